@@ -0,0 +1,378 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+from argparse import ArgumentParser
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+from cache import (
+    DEFAULT_CACHE_FOLDER,
+    ManifestGroup,
+    ReplayRow,
+    TranscriptCache
+)
+from languages import Languages
+from metric import WordErrorRate
+from replay import with_current_references
+from scoring import (
+    ScoringVariant,
+    normalize_pair,
+    reference_normalizer,
+    restrict_punctuation
+)
+
+AlignedUtterance = namedtuple(
+    "AlignedUtterance",
+    [
+        "index",
+        "audio_path",
+        "duration_sec",
+        "num_words",
+        "num_errors",
+        "errors",
+        "reference_tokens",
+        "transcript_tokens",
+    ],
+)
+
+# Side of a token in the inverted index
+REFERENCE = 0
+TRANSCRIPT = 1
+
+
+def align_rows(
+    language: Languages,
+    punctuation: bool,
+    punctuation_sets: Sequence[str],
+    rows: Sequence[ReplayRow],
+) -> List[AlignedUtterance]:
+    """
+    Aligns the words of each cached transcript with its reference. Transcripts are normalized like the references of
+    their run, the same way `VariantScorer` does, and the punctuation of both is then dropped.
+    """
+
+    normalizer = reference_normalizer(language, punctuation, punctuation_sets)
+    no_punctuation = ScoringVariant(False, "", "")
+
+    res = list()
+    for row in rows:
+        transcript, reference = normalize_pair(normalizer, language, transcript=row.transcript, reference=row.reference)
+        transcript = restrict_punctuation(transcript, no_punctuation)
+        reference = restrict_punctuation(reference, no_punctuation)
+        pairs = WordErrorRate.align(prediction=transcript, reference=reference)
+        errors = [(r, t) for r, t in pairs if r != t]
+        res.append(
+            AlignedUtterance(
+                index=row.index,
+                audio_path=row.audio_path,
+                duration_sec=row.audio_sec,
+                num_words=sum(1 for r, _ in pairs if r is not None),
+                num_errors=len(errors),
+                errors=errors,
+                reference_tokens=sorted(set(reference.split())),
+                transcript_tokens=sorted(set(transcript.split())),
+            )
+        )
+    return res
+
+
+class ErrorAnalysisStore(object):
+    """
+    Word alignments of cached transcripts, indexed for error analysis. Every run (engine, parameters, dataset, language
+    and punctuation settings of the transcript cache manifest) stores the per-utterance error counts, the non-matching
+    alignment pairs and an inverted index from the reference and transcript words to the utterances they occur in.
+    """
+
+    FILENAME = "analysis.sqlite3"
+
+    def __init__(self, folder: str = DEFAULT_CACHE_FOLDER) -> None:
+        os.makedirs(folder, exist_ok=True)
+
+        self._connection = sqlite3.connect(os.path.join(folder, self.FILENAME), timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "run_id INTEGER PRIMARY KEY, "
+            "engine TEXT NOT NULL, "
+            "params TEXT NOT NULL, "
+            "dataset TEXT NOT NULL, "
+            "language TEXT NOT NULL, "
+            "punctuation INTEGER NOT NULL, "
+            "punctuation_set TEXT NOT NULL, "
+            "UNIQUE (engine, params, dataset, language, punctuation, punctuation_set));"
+            "CREATE TABLE IF NOT EXISTS utterances ("
+            "run_id INTEGER NOT NULL, "
+            "idx INTEGER NOT NULL, "
+            "audio_path TEXT, "
+            "duration_sec REAL, "
+            "num_words INTEGER NOT NULL, "
+            "num_errors INTEGER NOT NULL, "
+            "PRIMARY KEY (run_id, idx)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS errors ("
+            "run_id INTEGER NOT NULL, "
+            "idx INTEGER NOT NULL, "
+            "reference TEXT, "
+            "transcript TEXT);"
+            "CREATE INDEX IF NOT EXISTS errors_by_run ON errors (run_id, reference, transcript);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "token TEXT NOT NULL, "
+            "run_id INTEGER NOT NULL, "
+            "idx INTEGER NOT NULL, "
+            "side INTEGER NOT NULL, "
+            "PRIMARY KEY (token, run_id, idx, side)) WITHOUT ROWID;"
+        )
+        self._connection.commit()
+
+    def _run_id(self, group: ManifestGroup) -> int:
+        key = [group.engine, group.params, group.dataset, group.language, int(group.punctuation), group.punctuation_set]
+        self._connection.execute(
+            "INSERT OR IGNORE INTO runs (engine, params, dataset, language, punctuation, punctuation_set) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            key,
+        )
+        return self._connection.execute(
+            "SELECT run_id FROM runs WHERE engine = ? AND params = ? AND dataset = ? AND language = ? "
+            "AND punctuation = ? AND punctuation_set = ?",
+            key,
+        ).fetchone()[0]
+
+    def clear_run(self, group: ManifestGroup) -> None:
+        run_id = self._run_id(group)
+        for table in ["utterances", "errors", "postings"]:
+            self._connection.execute(f"DELETE FROM {table} WHERE run_id = ?", [run_id])
+        self._connection.commit()
+
+    def add(self, group: ManifestGroup, utterances: Sequence[AlignedUtterance]) -> None:
+        run_id = self._run_id(group)
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO utterances VALUES (?, ?, ?, ?, ?, ?)",
+            [[run_id, x.index, x.audio_path, x.duration_sec, x.num_words, x.num_errors] for x in utterances],
+        )
+        self._connection.executemany(
+            "INSERT INTO errors VALUES (?, ?, ?, ?)",
+            [[run_id, x.index, r, t] for x in utterances for r, t in x.errors],
+        )
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO postings VALUES (?, ?, ?, ?)",
+            [[token, run_id, x.index, REFERENCE] for x in utterances for token in x.reference_tokens]
+            + [[token, run_id, x.index, TRANSCRIPT] for x in utterances for token in x.transcript_tokens],
+        )
+        self._connection.commit()
+
+    def run_ids(
+        self,
+        engine: str,
+        dataset: str,
+        language: str,
+        punctuation: Optional[bool] = None,
+        engine_params: Optional[Mapping[str, str]] = None,
+    ) -> List[int]:
+        """Runs that match, optionally only those whose engine parameters include `engine_params` (compared as text)."""
+
+        query = "SELECT run_id, params FROM runs WHERE engine = ? AND dataset = ? AND language = ?"
+        params = [engine, dataset, language]
+        if punctuation is not None:
+            query += " AND punctuation = ?"
+            params.append(int(punctuation))
+
+        res = list()
+        for run_id, run_params in self._connection.execute(query, params):
+            run_params = json.loads(run_params)
+            if engine_params is None or all(str(run_params.get(k)) == v for k, v in engine_params.items()):
+                res.append(run_id)
+        return res
+
+    def top_errors(
+        self, run_ids: Sequence[int], kind: str, limit: int
+    ) -> List[Tuple[Optional[str], Optional[str], int]]:
+        condition = {
+            "substitutions": "reference IS NOT NULL AND transcript IS NOT NULL",
+            "deletions": "transcript IS NULL",
+            "insertions": "reference IS NULL",
+        }[kind]
+        return self._connection.execute(
+            f"SELECT reference, transcript, COUNT(*) AS n FROM errors "
+            f"WHERE run_id IN ({', '.join('?' * len(run_ids))}) AND {condition} "
+            f"GROUP BY reference, transcript ORDER BY n DESC LIMIT ?",
+            [*run_ids, limit],
+        ).fetchall()
+
+    def compare(self, run_id_a: int, run_id_b: int, limit: int) -> List[Tuple[int, str, int, int, int]]:
+        """Utterances where run A makes fewer errors than run B, largest difference first."""
+
+        return self._connection.execute(
+            "SELECT a.idx, a.audio_path, a.num_words, a.num_errors, b.num_errors FROM utterances AS a "
+            "JOIN utterances AS b ON b.run_id = ? AND b.idx = a.idx "
+            "WHERE a.run_id = ? AND a.num_errors < b.num_errors "
+            "ORDER BY b.num_errors - a.num_errors DESC, a.idx LIMIT ?",
+            [run_id_b, run_id_a, limit],
+        ).fetchall()
+
+    def find(
+        self, run_ids: Sequence[int], token: str, side: Optional[int], limit: int
+    ) -> List[Tuple[int, str, int, int]]:
+        """Utterances whose reference and/or transcript contain `token`, most errors first."""
+
+        query = (
+            "SELECT DISTINCT u.idx, u.audio_path, u.num_words, u.num_errors FROM postings AS p "
+            "JOIN utterances AS u ON u.run_id = p.run_id AND u.idx = p.idx "
+            f"WHERE p.token = ? AND p.run_id IN ({', '.join('?' * len(run_ids))})"
+        )
+        params = [token, *run_ids]
+        if side is not None:
+            query += " AND p.side = ?"
+            params.append(side)
+        query += " ORDER BY u.num_errors DESC, u.idx LIMIT ?"
+        return self._connection.execute(query, [*params, limit]).fetchall()
+
+    def duration_buckets(self, run_ids: Sequence[int], bucket_sec: float) -> List[Tuple[float, int, int, int]]:
+        """Number of utterances, words and errors per duration bucket."""
+
+        return self._connection.execute(
+            "SELECT CAST(duration_sec / ? AS INTEGER) * ? AS bucket, COUNT(*), SUM(num_words), SUM(num_errors) "
+            f"FROM utterances WHERE run_id IN ({', '.join('?' * len(run_ids))}) GROUP BY bucket ORDER BY bucket",
+            [bucket_sec, bucket_sec, *run_ids],
+        ).fetchall()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def build(args) -> None:
+    cache = TranscriptCache(args.cache_folder)
+    groups = cache.manifest_groups()
+    if args.engines is not None:
+        groups = [g for g in groups if g.engine in args.engines]
+    if args.datasets is not None:
+        groups = [g for g in groups if g.dataset in args.datasets]
+    if args.languages is not None:
+        groups = [g for g in groups if g.language in args.languages]
+    group_rows = {group: cache.replay_rows(group) for group in groups}
+    cache.close()
+    group_rows = with_current_references(group_rows)
+
+    store = ErrorAnalysisStore(args.cache_folder)
+    with ProcessPoolExecutor(args.num_workers) as executor:
+        for group, rows in group_rows.items():
+            futures = [
+                executor.submit(
+                    align_rows,
+                    language=Languages(group.language),
+                    punctuation=group.punctuation,
+                    # Runs that scored several punctuation sets record them separated by spaces
+                    punctuation_sets=group.punctuation_set.split(),
+                    rows=rows[i : i + args.chunk_size],
+                )
+                for i in range(0, len(rows), args.chunk_size)
+            ]
+            store.clear_run(group)
+            for future in futures:
+                store.add(group, future.result())
+            print(f"Indexed {group.engine} {group.dataset} {group.language} ({len(rows)} utterances)")
+    store.close()
+
+
+def select_run_ids(store: ErrorAnalysisStore, engine: str, args) -> List[int]:
+    punctuation = None if args.punctuation is None else args.punctuation == "yes"
+    engine_params = None
+    if args.params is not None:
+        engine_params = dict(x.split("=", 1) for x in args.params)
+    run_ids = store.run_ids(engine, args.dataset, args.language, punctuation=punctuation, engine_params=engine_params)
+    if len(run_ids) == 0:
+        raise ValueError(f"No indexed run of `{engine}` on `{args.dataset}` `{args.language}`, run `index` first")
+    return run_ids
+
+
+def main():
+    parser = ArgumentParser(description="Index the word alignments of cached transcripts and query their errors")
+    parser.add_argument("--cache-folder", default=DEFAULT_CACHE_FOLDER)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="Align every cached transcript of the manifest and index it")
+    index_parser.add_argument("--engines", nargs="+", default=None)
+    index_parser.add_argument("--datasets", nargs="+", default=None)
+    index_parser.add_argument("--languages", nargs="+", default=None, choices=[x.value for x in Languages])
+    index_parser.add_argument("--chunk-size", type=int, default=1000)
+    index_parser.add_argument("--num-workers", type=int, default=os.cpu_count())
+
+    def add_run_arguments(x: ArgumentParser, engine_arguments: Sequence[str] = ("--engine",)) -> None:
+        for engine_argument in engine_arguments:
+            x.add_argument(engine_argument, required=True)
+        x.add_argument("--dataset", required=True)
+        x.add_argument("--language", required=True, choices=[x.value for x in Languages])
+        x.add_argument(
+            "--punctuation",
+            choices=["yes", "no"],
+            default=None,
+            help="Only use runs with or without punctuation (by default both are combined)",
+        )
+        x.add_argument(
+            "--params",
+            nargs="+",
+            default=None,
+            help="Only use runs whose engine parameters include these `KEY=VALUE` pairs (e.g. `upload_encoding=FLAC`)",
+        )
+        x.add_argument("--limit", type=int, default=20)
+
+    top_parser = subparsers.add_parser("top-errors", help="Most frequent substituted, deleted or inserted words")
+    add_run_arguments(top_parser)
+    top_parser.add_argument("--kind", choices=["substitutions", "deletions", "insertions"], default="substitutions")
+
+    compare_parser = subparsers.add_parser("compare", help="Utterances where engine A makes fewer errors than B")
+    add_run_arguments(compare_parser, engine_arguments=("--engine-a", "--engine-b"))
+
+    find_parser = subparsers.add_parser("find", help="Utterances containing a word, most errors first")
+    add_run_arguments(find_parser)
+    find_parser.add_argument("--token", required=True)
+    find_parser.add_argument("--side", choices=["reference", "transcript"], default=None)
+
+    duration_parser = subparsers.add_parser("duration-buckets", help="WER per utterance duration bucket")
+    add_run_arguments(duration_parser)
+    duration_parser.add_argument("--bucket-sec", type=float, default=5.0)
+
+    args = parser.parse_args()
+
+    if args.command == "index":
+        build(args)
+        return
+
+    store = ErrorAnalysisStore(args.cache_folder)
+    start_sec = time.time()
+
+    if args.command == "top-errors":
+        run_ids = select_run_ids(store, args.engine, args)
+        for reference, transcript, count in store.top_errors(run_ids, args.kind, args.limit):
+            print(f"{count:>8}  {reference or '-'} -> {transcript or '-'}")
+    elif args.command == "compare":
+        run_ids_a = select_run_ids(store, args.engine_a, args)
+        run_ids_b = select_run_ids(store, args.engine_b, args)
+        if len(run_ids_a) > 1 or len(run_ids_b) > 1:
+            raise ValueError("Several runs match, use `--punctuation` and `--params` to select one per engine")
+        for index, audio_path, num_words, errors_a, errors_b in store.compare(run_ids_a[0], run_ids_b[0], args.limit):
+            print(f"{index:>8}  {errors_a:>4} vs {errors_b:>4} errors / {num_words:>4} words  {audio_path}")
+    elif args.command == "find":
+        side = None if args.side is None else (REFERENCE if args.side == "reference" else TRANSCRIPT)
+        run_ids = select_run_ids(store, args.engine, args)
+        for index, audio_path, num_words, num_errors in store.find(run_ids, args.token, side, args.limit):
+            print(f"{index:>8}  {num_errors:>4} errors / {num_words:>4} words  {audio_path}")
+    elif args.command == "duration-buckets":
+        rows = store.duration_buckets(select_run_ids(store, args.engine, args), args.bucket_sec)
+        for bucket, num_utterances, num_words, num_errors in rows:
+            wer = 100 * float(num_errors) / num_words if num_words > 0 else 0.0
+            print(f"{bucket:>6.1f}s  {num_utterances:>6} utterances  WER: {wer:.2f}")
+
+    store.close()
+    print(f"({time.time() - start_sec:.3f} sec)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,167 @@
 import math
+import multiprocessing
 import os
 import random
+import sys
+import time
 from argparse import ArgumentParser
 from collections import namedtuple
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait
+)
+from enum import Enum
+from functools import partial
 from typing import (
     Any,
     Dict,
+    Optional,
     Sequence
 )
 
+import soundfile
+
+from cache import (
+    DEFAULT_CACHE_FOLDER,
+    ManifestGroup,
+    ManifestRow,
+    TranscriptCache
+)
 from dataset import (
     Dataset,
     Datasets
 )
 from engine import (
     Engine,
-    Engines
+    Engines,
+    TimingCounters,
+    UploadEncoder,
+    UploadEncodings
+)
+from journal import (
+    Journal,
+    UtteranceResult
 )
 from languages import Languages
-from metric import (
-    Metric,
-    Metrics
+from memory import (
+    auto_num_workers,
+    current_rss_bytes,
+    measure_engine_footprint,
+    peak_rss_bytes
+)
+from metric import Metrics
+from normalizer import SUPPORTED_PUNCTUATION_SET
+from pipeline import (
+    AudioPrefetcher,
+    Stage
+)
+from profiling import (
+    Profilers,
+    clear_profiles,
+    format_modules,
+    run_profiled,
+    write_report
+)
+from progress import ProgressMonitor
+from scoring import (
+    RESULTS_FOLDER,
+    VariantScorer,
+    read_results_log,
+    scoring_variants,
+    union_punctuation_set
+)
+from shared_audio import (
+    SharedAudioReader,
+    assign_jobs,
+    run_decoder,
+    stop_decoders
+)
+from streaming import (
+    StreamingClocks,
+    StreamingStats,
+    summarize
+)
+from tracing import (
+    clear_traces,
+    merge_traces,
+    run_traced,
+    span,
+    start as start_tracing,
+    stop as stop_tracing
+)
+from utterances import (
+    UtteranceTableFormats,
+    save_utterance_table,
+    utterance_columns
+)
+
+WorkerResult = namedtuple(
+    "WorkerResult",
+    [
+        "source_bytes",
+        "upload_bytes",
+        "upload_sec",
+        "cache_hits",
+        "cache_misses",
+        "load_sec",
+        "pid",
+        "peak_rss_bytes",
+        "remaining",
+    ],
 )
-from normalizer import (
-    SUPPORTED_PUNCTUATION_SET,
-    EnglishNormalizer,
-    Normalizer
+
+# Output of the transcription stage of a worker, with the engine counters measured around `transcribe`
+Transcription = namedtuple(
+    "Transcription",
+    [
+        "index",
+        "audio_path",
+        "reference",
+        "transcript",
+        "audio_sec",
+        "process_sec",
+        "streaming",
+        "warmup",
+        "timings",
+        "audio_hash",
+    ],
 )
 
-WorkerResult = namedtuple("WorkerResult", ["metric", "num_errors", "num_tokens", "audio_sec", "process_sec"])
-RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), "results")
+CLOUD_UPLOAD_ENGINES = [
+    Engines.AMAZON_TRANSCRIBE,
+    Engines.GOOGLE_SPEECH_TO_TEXT,
+    Engines.GOOGLE_SPEECH_TO_TEXT_ENHANCED,
+    Engines.IBM_WATSON_SPEECH_TO_TEXT,
+]
+
+WHISPER_ENGINES = [
+    Engines.WHISPER_TINY,
+    Engines.WHISPER_BASE,
+    Engines.WHISPER_SMALL,
+    Engines.WHISPER_MEDIUM,
+    Engines.WHISPER_LARGE,
+    Engines.WHISPER_LARGE_V2,
+    Engines.WHISPER_LARGE_V3,
+]
+
+LOCAL_ENGINES = [
+    Engines.WHISPER_TINY,
+    Engines.WHISPER_BASE,
+    Engines.WHISPER_SMALL,
+    Engines.WHISPER_MEDIUM,
+    Engines.WHISPER_LARGE,
+    Engines.WHISPER_LARGE_V2,
+    Engines.WHISPER_LARGE_V3,
+    Engines.PICOVOICE_CHEETAH,
+    Engines.PICOVOICE_LEOPARD,
+]
+
+
+class Executors(Enum):
+    PROCESSES = "processes"
+    THREADS = "threads"
 
 
 def process(
@@ -38,60 +169,191 @@ def process(
     engine_params: Dict[str, Any],
     language: Languages,
     punctuation: bool,
-    punctuation_set: str,
+    punctuation_sets: Sequence[str],
     dataset_name: Datasets,
     dataset_folder: str,
     indices: Sequence[int],
-    metric_names: Sequence[Metrics],
-) -> Sequence[WorkerResult]:
-    engine = Engine.create(engine_name, language=language, **engine_params)
-    dataset = Dataset.create(
-        dataset_name,
-        folder=dataset_folder,
-        language=language,
-        punctuation=punctuation,
-        punctuation_set=punctuation_set,
-    )
-    normalizer = Normalizer.create(language=language, keep_punctuation=punctuation, punctuation_set=punctuation_set)
+    metric_names: Optional[Sequence[Metrics]],
+    journal_folder: str,
+    cache_folder: Optional[str] = None,
+    results_log: Optional[str] = None,
+    run_id: Optional[str] = None,
+    num_warmup: int = 0,
+    preload_audio: bool = False,
+    prefetch: int = 0,
+    shared_audio: Optional[SharedAudioReader] = None,
+    max_utterances: Optional[int] = None,
+    max_rss_mb: Optional[float] = None,
+) -> WorkerResult:
+    load_start_sec = time.time()
+    with span("engine create"):
+        engine = Engine.create(engine_name, language=language, **engine_params)
+    load_sec = time.time() - load_start_sec
+    with span("dataset load"):
+        dataset = Dataset.create(
+            dataset_name,
+            folder=dataset_folder,
+            language=language,
+            punctuation=punctuation,
+            punctuation_set=union_punctuation_set(punctuation_sets),
+        )
 
-    metrics = {m: Metric.create(m) for m in metric_names}
-    results = {m: {"num_errors": 0, "num_tokens": 0} for m in metric_names}
+    cache = TranscriptCache(cache_folder) if cache_folder is not None else None
+    engine.attach_cache(cache)
+    # A recycled worker only gets to the first `max_utterances`, the rest are handed to its successor
+    audio_paths = [dataset.get(index)[0] for index in indices[:max_utterances]]
+    with span("cache prefetch"):
+        engine.prefetch_cache(audio_paths)
+    # The audio of cache hits is never decoded
+    decode_paths = [x for x in audio_paths if not engine.has_cached_transcript(x)]
+    if preload_audio:
+        with span("audio preload"):
+            engine.preload_audio(decode_paths)
+    scorer = VariantScorer(language, scoring_variants(punctuation, punctuation_sets), metric_names)
+    journal = Journal(journal_folder)
 
-    for index in indices:
-        audio_path, ref_transcript = dataset.get(index)
+    manifest_rows = []
 
-        transcript = engine.transcribe(audio_path)
-        norm_transcript = normalizer.normalize(transcript)
+    def finish(x: Transcription) -> None:
+        with span("score"):
+            scores, num_reference_words, num_transcript_words = scorer.score_utterance(
+                transcript=x.transcript,
+                reference=x.reference,
+            )
+        with span("audio info"):
+            duration_sec = soundfile.info(x.audio_path).duration
+        result = UtteranceResult(
+            index=x.index,
+            num_errors={metric_name: num_errors for metric_name, (num_errors, _) in scores.items()},
+            num_tokens={metric_name: num_tokens for metric_name, (_, num_tokens) in scores.items()},
+            audio_sec=x.audio_sec,
+            process_sec=x.process_sec,
+            audio_path=x.audio_path,
+            duration_sec=duration_sec,
+            num_reference_words=num_reference_words,
+            num_transcript_words=num_transcript_words,
+            streaming=x.streaming,
+            warmup=x.warmup,
+            timings=x.timings,
+        )
+        with span("journal append"):
+            journal.append(result)
+
+        if cache is not None:
+            manifest_rows.append(
+                ManifestRow(
+                    index=x.index,
+                    audio_path=x.audio_path,
+                    audio_hash=x.audio_hash,
+                    audio_sec=duration_sec,
+                    reference=x.reference,
+                )
+            )
+
+    # With `prefetch`, audio is decoded ahead on one thread and transcripts are scored on another while the engine runs
+    remaining = list()
+    prefetcher = None
+    scoring_stage = None
+    if prefetch > 0:
+        if engine.DECODES_AUDIO and not preload_audio and shared_audio is None:
+            prefetcher = AudioPrefetcher(decode_paths, depth=prefetch)
+        scoring_stage = Stage(finish, depth=prefetch)
+
+    try:
+        for position, index in enumerate(indices):
+            audio_path, ref_transcript = dataset.get(index)
+            descriptor = None
+            if shared_audio is not None:
+                descriptor, audio = shared_audio.get(audio_path)
+                engine.provide_audio(audio_path, audio, descriptor.sample_rate, descriptor.decode_sec)
+                del audio
+            elif prefetcher is not None and not engine.has_cached_transcript(audio_path):
+                engine.provide_audio(audio_path, *prefetcher.get(audio_path))
 
-        ref_sentence = ref_transcript.strip("\n ").lower()
-        transcribed_sentence = norm_transcript.strip("\n ").lower()
+            audio_sec = max(engine.audio_sec(), 0.0)
+            process_sec = max(engine.process_sec(), 0.0)
+            timings = engine.timings()
+            try:
+                with span("transcribe"):
+                    transcript = engine.transcribe(audio_path)
+            finally:
+                if descriptor is not None:
+                    engine.discard_provided_audio()
+                    shared_audio.release(descriptor)
 
-        if language == Languages.EN:
-            ref_sentence = EnglishNormalizer.to_american(EnglishNormalizer.normalize_abbreviations(ref_sentence))
-            transcribed_sentence = EnglishNormalizer.to_american(
-                EnglishNormalizer.normalize_abbreviations(transcribed_sentence)
+            streaming_stats = engine.last_streaming_stats()
+            transcription = Transcription(
+                index=index,
+                audio_path=audio_path,
+                reference=ref_transcript,
+                transcript=transcript,
+                audio_sec=max(engine.audio_sec(), 0.0) - audio_sec,
+                process_sec=max(engine.process_sec(), 0.0) - process_sec,
+                streaming=streaming_stats._asdict() if streaming_stats is not None else None,
+                warmup=position < num_warmup,
+                timings={k.value: v - timings[k] for k, v in engine.timings().items()},
+                audio_hash=engine.audio_hash(audio_path) if cache is not None else None,
             )
+            if scoring_stage is not None:
+                scoring_stage.put(transcription)
+            else:
+                finish(transcription)
 
-        for metric_name, metric in metrics.items():
-            num_errors, num_tokens = metric.calculate(prediction=transcribed_sentence, reference=ref_sentence)
-            results[metric_name]["num_errors"] += num_errors
-            results[metric_name]["num_tokens"] += num_tokens
+            # The parent hands the remaining utterances to a fresh process
+            if (max_utterances is not None and position + 1 >= max_utterances) or (
+                max_rss_mb is not None and current_rss_bytes() > max_rss_mb * 1024 * 1024
+            ):
+                remaining = list(indices[position + 1 :])
+                break
+    except BaseException:
+        if shared_audio is not None:
+            shared_audio.drain()
+        if scoring_stage is not None:
+            # The error in flight takes precedence over an error of the scoring stage
+            scoring_stage.close(raise_error=False)
+            scoring_stage = None
+        raise
+    finally:
+        try:
+            if prefetcher is not None:
+                prefetcher.close()
+        finally:
+            try:
+                if scoring_stage is not None:
+                    scoring_stage.close()
+            finally:
+                if shared_audio is not None:
+                    shared_audio.close()
 
+    journal.close()
     engine.delete()
-
-    worker_results = []
-    for metric_name in metric_names:
-        worker_results.append(
-            WorkerResult(
-                metric=metric_name.value,
-                num_errors=results[metric_name]["num_errors"],
-                num_tokens=results[metric_name]["num_tokens"],
-                audio_sec=engine.audio_sec(),
-                process_sec=engine.process_sec(),
+    if cache is not None:
+        if results_log is not None and run_id is not None:
+            manifest_group = ManifestGroup(
+                engine=engine_name.value,
+                engine_name=str(engine),
+                params=TranscriptCache.serialize_params(engine.cache_params()),
+                dataset=dataset_name.value,
+                language=language.value,
+                punctuation=punctuation,
+                punctuation_set=" ".join(punctuation_sets),
+                results_log=results_log,
+                dataset_folder=dataset_folder,
             )
-        )
+            cache.record_manifest(manifest_group, run_id, manifest_rows)
+        cache.close()
 
-    return worker_results
+    return WorkerResult(
+        source_bytes=engine.source_bytes(),
+        upload_bytes=engine.upload_bytes(),
+        upload_sec=engine.upload_sec(),
+        cache_hits=cache.num_hits() + cache.num_imports() if cache is not None else 0,
+        cache_misses=cache.num_misses() - cache.num_imports() if cache is not None else 0,
+        load_sec=load_sec,
+        pid=os.getpid(),
+        peak_rss_bytes=peak_rss_bytes(),
+        remaining=remaining,
+    )
 
 
 def main():
@@ -101,7 +363,20 @@ def main():
     parser.add_argument("--dataset-folder", required=True)
     parser.add_argument("--language", required=True, choices=[x.value for x in Languages])
     parser.add_argument("--punctuation", action="store_true")
-    parser.add_argument("--punctuation-set", type=str, default=".?")
+    parser.add_argument(
+        "--punctuation-set",
+        nargs="+",
+        default=[".?"],
+        help="One or more punctuation sets. Several sets are scored in one run together with WER",
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="+",
+        choices=[x.value for x in Metrics],
+        default=None,
+        help="Metrics to report (default PER with `--punctuation`, else WER). `ALL` aligns each pair once for WER with "
+        "substitutions, deletions and insertions, CER and PER",
+    )
     parser.add_argument("--aws-profile")
     parser.add_argument("--azure-speech-key")
     parser.add_argument("--azure-speech-location")
@@ -111,20 +386,159 @@ def main():
     parser.add_argument("--picovoice-library-path", default=None)
     parser.add_argument("--watson-speech-to-text-api-key")
     parser.add_argument("--watson-speech-to-text-url")
+    parser.add_argument("--upload-encoding", choices=[x.value for x in UploadEncodings], default=UploadEncodings.FLAC.value)
+    parser.add_argument("--upload-bitrate", type=int, default=32, help="Upload bitrate in kbps for lossy encodings")
+    parser.add_argument("--cache-folder", default=DEFAULT_CACHE_FOLDER)
+    parser.add_argument("--disable-cache", action="store_true")
+    parser.add_argument("--cache-picovoice", action="store_true", help="Also cache Picovoice Cheetah/Leopard transcripts")
+    parser.add_argument("--resume", action="store_true", help="Skip utterances completed by a previous interrupted run")
+    parser.add_argument(
+        "--streaming-clock",
+        choices=[x.value for x in StreamingClocks],
+        default=None,
+        help="Measure PICOVOICE_CHEETAH streaming latencies with frames paced in real time or on a virtual clock",
+    )
+    parser.add_argument(
+        "--utterance-table-format",
+        choices=[x.value for x in UtteranceTableFormats],
+        default=UtteranceTableFormats.NPZ.value,
+        help="File format of the per-utterance results written next to the results log (`parquet` requires pyarrow)",
+    )
+    parser.add_argument(
+        "--warmup-utterances",
+        type=int,
+        default=0,
+        help="Number of utterances per worker whose timing is reported as warm-up and excluded from steady-state RTF",
+    )
+    parser.add_argument(
+        "--preload-audio",
+        action="store_true",
+        help="Decode all audio of a worker into memory before transcribing so that local engines time only inference",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        help="Decode up to this many utterances ahead and score transcripts on separate threads (0 runs sequentially)",
+    )
+    parser.add_argument(
+        "--decoder-processes",
+        type=int,
+        default=0,
+        help="Decode audio in this many separate processes and hand it to the engine workers through shared memory",
+    )
+    parser.add_argument(
+        "--shared-audio-mb",
+        type=int,
+        default=256,
+        help="Size of the shared audio ring buffer of every decoder process",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=[x.value for x in Profilers],
+        default=None,
+        help="Run every worker under cProfile or a sampling profiler and write a merged report next to the results log",
+    )
+    parser.add_argument(
+        "--flamegraph-output",
+        default=None,
+        help="Path of a collapsed-stack file for `flamegraph.pl` (requires `--profile SAMPLING`)",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Record the stages of every worker and write them next to the results log as a Chrome trace",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between progress reports while the workers run (0 disables them)",
+    )
+    parser.add_argument(
+        "--progress-json",
+        default=None,
+        help="Path of a file every progress report is also appended to as a JSON line",
+    )
     parser.add_argument("--num-examples", type=int, default=None)
-    parser.add_argument("--num-workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=None,
+        help="Defaults to one per core, or for local engines to as many as fit in `--memory-headroom` of the available "
+        "memory, at most one per core",
+    )
+    parser.add_argument(
+        "--memory-headroom",
+        type=float,
+        default=0.8,
+        help="Fraction of the available memory the automatically sized workers may use",
+    )
+    parser.add_argument(
+        "--recycle-after",
+        type=int,
+        default=None,
+        help="Replace every worker process with a fresh one after this many utterances",
+    )
+    parser.add_argument(
+        "--max-worker-rss-mb",
+        type=float,
+        default=None,
+        help="Replace a worker process with a fresh one once its resident memory exceeds this",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=[x.value for x in Executors],
+        default=Executors.PROCESSES.value,
+        help="Run workers as processes or as threads of one process. With threads, Whisper loads its weights once",
+    )
     args = parser.parse_args()
 
     engine = Engines(args.engine)
     dataset_type = Datasets(args.dataset)
     language = Languages(args.language)
     punctuation = args.punctuation
-    punctuation_set = args.punctuation_set
-    dataset_folder = args.dataset_folder
+    punctuation_sets = args.punctuation_set
+    # Absolute so that `replay.py` finds the same audio paths when it reloads the references of the run
+    dataset_folder = os.path.abspath(args.dataset_folder)
     num_examples = args.num_examples
     num_workers = args.num_workers
+    upload_encoding = UploadEncodings(args.upload_encoding)
+    upload_bitrate = args.upload_bitrate
+    utterance_table_format = UtteranceTableFormats(args.utterance_table_format)
+    executor_type = Executors(args.executor)
+    profiler = Profilers(args.profile) if args.profile is not None else None
+
+    if args.flamegraph_output is not None and profiler is not Profilers.SAMPLING:
+        raise ValueError(f"`flamegraph-output` requires `--profile {Profilers.SAMPLING.value}`")
+
+    cache_folder = None if args.disable_cache else args.cache_folder
+    if engine in [Engines.PICOVOICE_CHEETAH, Engines.PICOVOICE_LEOPARD] and not args.cache_picovoice:
+        cache_folder = None
+
+    if args.streaming_clock is not None and engine is not Engines.PICOVOICE_CHEETAH:
+        raise ValueError(f"`streaming-clock` is only supported for {Engines.PICOVOICE_CHEETAH.value}")
+
+    recycle = args.recycle_after is not None or args.max_worker_rss_mb is not None
+    if recycle and executor_type is not Executors.PROCESSES:
+        raise ValueError("`recycle-after` and `max-worker-rss-mb` require the processes executor")
+
+    if args.decoder_processes > 0:
+        if engine not in LOCAL_ENGINES:
+            raise ValueError(f"`decoder-processes` is only supported for {[x.value for x in LOCAL_ENGINES]}")
+        if args.preload_audio:
+            raise ValueError("`decoder-processes` and `preload-audio` cannot be combined")
+
+    if upload_encoding is not UploadEncodings.FLAC and engine not in CLOUD_UPLOAD_ENGINES:
+        raise ValueError(f"`upload-encoding` is only supported for {[x.value for x in CLOUD_UPLOAD_ENGINES]}")
 
     engine_params = dict()
+    if engine in CLOUD_UPLOAD_ENGINES:
+        engine_params["upload_encoder"] = UploadEncoder(encoding=upload_encoding, bitrate_kbps=upload_bitrate)
+
+    if executor_type is Executors.THREADS and engine in WHISPER_ENGINES:
+        engine_params["share_model"] = True
+
     if engine == Engines.AMAZON_TRANSCRIBE:
         if args.aws_profile is None:
             raise ValueError("`aws-profile` is required")
@@ -147,6 +561,8 @@ def main():
         engine_params["model_path"] = args.picovoice_model_path
         engine_params["library_path"] = args.picovoice_library_path
         engine_params["punctuation"] = punctuation
+        if args.streaming_clock is not None:
+            engine_params["streaming_clock"] = StreamingClocks(args.streaming_clock)
     elif engine == Engines.PICOVOICE_LEOPARD:
         if args.picovoice_access_key is None:
             raise ValueError("`picovoice-access-key` is required")
@@ -162,69 +578,291 @@ def main():
         engine_params["watson_speech_to_text_api_key"] = args.watson_speech_to_text_api_key
         engine_params["watson_speech_to_text_url"] = args.watson_speech_to_text_url
 
-    for p in punctuation_set:
-        if p not in SUPPORTED_PUNCTUATION_SET:
-            raise ValueError(f"`{p}` is not a supported punctuation character")
+    for punctuation_set in punctuation_sets:
+        for p in punctuation_set:
+            if p not in SUPPORTED_PUNCTUATION_SET:
+                raise ValueError(f"`{p}` is not a supported punctuation character")
 
     dataset = Dataset.create(
         dataset_type,
         folder=dataset_folder,
         language=language,
         punctuation=punctuation,
-        punctuation_set=punctuation_set,
+        punctuation_set=union_punctuation_set(punctuation_sets),
     )
-    indices = list(range(dataset.size()))
-    random.shuffle(indices)
-    if args.num_examples is not None:
-        indices = indices[:num_examples]
+    metrics = None if args.metrics is None else [Metrics(x) for x in args.metrics]
+
+    results_log_folder = os.path.join(RESULTS_FOLDER, language.value, dataset_type.value)
+    baseline_log_path = os.path.join(results_log_folder, f"{str(engine)}.log")
+    if upload_encoding is UploadEncodings.FLAC:
+        results_log_path = baseline_log_path
+    else:
+        results_log_path = os.path.join(
+            results_log_folder, f"{str(engine)}_{upload_encoding.value}_{upload_bitrate}kbps.log"
+        )
+    journal_folder = results_log_path.replace(".log", ".journal")
+
+    all_indices = Journal.load_indices(journal_folder) if args.resume else None
+    if all_indices is None:
+        all_indices = list(range(dataset.size()))
+        random.shuffle(all_indices)
+        if args.num_examples is not None:
+            all_indices = all_indices[:num_examples]
+        Journal.clear(journal_folder)
+        Journal.save_indices(journal_folder, all_indices)
+    run_id = Journal.run_id(journal_folder)
+
+    completed = Journal.load(journal_folder)
+    indices = [i for i in all_indices if i not in completed]
+    if len(completed) > 0:
+        print(f"Resuming: {len(completed)} of {len(all_indices)} examples already completed")
+
+    if num_workers is None:
+        # Cloud engines keep little in memory, and creating one may create cloud resources (e.g. an S3 bucket)
+        if executor_type is Executors.PROCESSES and engine in LOCAL_ENGINES:
+            with ProcessPoolExecutor(1) as executor:
+                footprint_bytes = executor.submit(measure_engine_footprint, engine, language, engine_params).result()
+            num_workers = auto_num_workers(footprint_bytes, args.memory_headroom, os.cpu_count())
+            print(f"Engine footprint: {footprint_bytes / (1024 * 1024):.0f} MB per worker, using {num_workers} workers")
+        else:
+            num_workers = os.cpu_count()
 
     chunk = math.ceil(len(indices) / num_workers)
 
-    metrics = [Metrics.PER] if punctuation else [Metrics.WER]
+    profile_folder = results_log_path.replace(".log", ".profile")
+    worker_fn = process
+    if profiler is not None:
+        clear_profiles(profile_folder)
+        worker_fn = partial(run_profiled, profiler, profile_folder, process)
 
-    print(f"Processing {len(indices)} examples...")
-    futures = []
-    with ProcessPoolExecutor(num_workers) as executor:
-        for i in range(num_workers):
-            future = executor.submit(
-                process,
-                engine_name=engine,
-                engine_params=engine_params,
-                language=language,
-                punctuation=punctuation,
-                punctuation_set=punctuation_set,
-                dataset_name=dataset_type,
-                dataset_folder=dataset_folder,
-                indices=indices[i * chunk : (i + 1) * chunk],
-                metric_names=metrics,
+    trace_folder = results_log_path.replace(".log", ".trace")
+    if args.trace:
+        clear_traces(trace_folder)
+        if executor_type is Executors.PROCESSES:
+            worker_fn = partial(run_traced, trace_folder, worker_fn)
+        else:
+            # Threads share the tracer of their process
+            start_tracing(trace_folder)
+
+    manager = None
+    decoders = list()
+    audio_queues = list()
+    release_queues = list()
+    shared_audio_readers = [None] * num_workers
+    if args.decoder_processes > 0:
+        manager = multiprocessing.Manager()
+        audio_queues = [manager.Queue() for _ in range(num_workers)]
+        release_queues = [manager.Queue() for _ in range(args.decoder_processes)]
+        worker_paths = [[dataset.get(x)[0] for x in indices[i * chunk : (i + 1) * chunk]] for i in range(num_workers)]
+        for i, jobs in enumerate(assign_jobs(worker_paths, args.decoder_processes)):
+            decoder = multiprocessing.Process(
+                target=run_decoder,
+                args=(i, jobs, audio_queues, release_queues[i], args.shared_audio_mb * 1024 * 1024),
+                daemon=True,
             )
-            futures.append(future)
+            decoder.start()
+            decoders.append(decoder)
+        shared_audio_readers = [SharedAudioReader(x, release_queues) for x in audio_queues]
+
+    print(f"Processing {len(indices)} examples...")
+    worker_results = []
+    errors = []
+    monitor = None
+    if args.progress_interval > 0:
+        monitor = ProgressMonitor(
+            journal_folder,
+            num_total=len(all_indices),
+            interval_sec=args.progress_interval,
+            json_path=args.progress_json,
+        )
+        monitor.start()
+    executor_class = ProcessPoolExecutor if executor_type is Executors.PROCESSES else ThreadPoolExecutor
+    # Recycled workers must start in new processes rather than reuse the process that grew
+    executor_params = {"max_tasks_per_child": 1} if recycle else dict()
+    peak_rss = dict()
+    run_start_sec = time.time()
+    try:
+        with executor_class(num_workers, **executor_params) as executor:
 
-    results = []
-    for future in futures:
-        results.extend(future.result())
+            def submit(worker: int, worker_indices: Sequence[int]):
+                return executor.submit(
+                    worker_fn,
+                    engine_name=engine,
+                    engine_params=engine_params,
+                    language=language,
+                    punctuation=punctuation,
+                    punctuation_sets=punctuation_sets,
+                    dataset_name=dataset_type,
+                    dataset_folder=dataset_folder,
+                    indices=worker_indices,
+                    metric_names=metrics,
+                    journal_folder=journal_folder,
+                    cache_folder=cache_folder,
+                    results_log=os.path.relpath(results_log_path, RESULTS_FOLDER),
+                    run_id=run_id,
+                    num_warmup=args.warmup_utterances,
+                    preload_audio=args.preload_audio,
+                    prefetch=args.prefetch,
+                    shared_audio=shared_audio_readers[worker],
+                    max_utterances=args.recycle_after,
+                    max_rss_mb=args.max_worker_rss_mb,
+                )
+
+            futures = {submit(i, indices[i * chunk : (i + 1) * chunk]): i for i in range(num_workers)}
+            while len(futures) > 0:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    worker = futures.pop(future)
+                    try:
+                        worker_result = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        # Fail the remaining workers now. Otherwise workers of a shared decoder wait for audio that
+                        # never comes once the decoder's ring is full of the failed worker's utterances.
+                        if len(errors) == 1:
+                            stop_decoders(audio_queues, release_queues)
+                            for x in futures:
+                                x.cancel()
+                        continue
+                    worker_results.append(worker_result)
+                    # Threads share one process. A recycled worker slot holds one process at a time.
+                    key = worker if executor_type is Executors.PROCESSES else worker_result.pid
+                    peak_rss[key] = max(peak_rss.get(key, 0), worker_result.peak_rss_bytes)
+                    if len(worker_result.remaining) > 0 and len(errors) == 0:
+                        futures[submit(worker, worker_result.remaining)] = worker
+    except KeyboardInterrupt as e:
+        errors.append(e)
+    finally:
+        run_sec = time.time() - run_start_sec
+        if monitor is not None:
+            monitor.stop()
+        if args.trace and executor_type is Executors.THREADS:
+            stop_tracing()
+        # Decoders wait for workers to release their audio, which an interrupted worker may never do
+        stop_decoders(audio_queues, release_queues)
+        for x in decoders:
+            x.join()
+        if manager is not None:
+            manager.shutdown()
+
+    results = list(Journal.load(journal_folder).values())
+    if len(results) == 0:
+        if len(errors) > 0:
+            raise errors[0]
+        raise ValueError("No examples were processed")
 
     metric_results = {}
     for result in results:
-        if result.metric not in metric_results:
-            metric_results[result.metric] = []
-        metric_results[result.metric].append(result)
+        for metric_name in result.num_errors.keys():
+            if metric_name not in metric_results:
+                metric_results[metric_name] = []
+            metric_results[metric_name].append(result)
+
+    audio_sec = sum(x.audio_sec for x in results)
+    rtf = sum(x.process_sec for x in results) / audio_sec if audio_sec > 0 else None
+
+    timings = dict()
+    for name, warmup in [("Warm-up RTF", True), ("Steady-state RTF", False)]:
+        subset = [x for x in results if bool(x.warmup) == warmup]
+        subset_audio_sec = sum(x.audio_sec for x in subset)
+        if subset_audio_sec > 0:
+            timings[name] = sum(x.process_sec for x in subset) / subset_audio_sec
+    for counter in TimingCounters:
+        counter_sec = sum(x.timings.get(counter.value, 0.0) for x in results if x.timings is not None)
+        if counter_sec > 0:
+            timings[f"{counter.value.capitalize()} sec"] = counter_sec
+    if len(worker_results) > 0:
+        timings["Model load sec"] = sum(x.load_sec for x in worker_results) / len(worker_results)
+        timings["Model load sec max"] = max(x.load_sec for x in worker_results)
+
+    # Throughput of this run only, so that processes and threads can be compared on the same hardware
+    run_audio_sec = sum(x.audio_sec for x in results if x.index not in completed)
+    if run_sec > 0:
+        timings["Throughput audio sec per sec"] = run_audio_sec / run_sec
+    if len(peak_rss) > 0:
+        timings["Workers peak RSS MB"] = sum(peak_rss.values()) / (1024 * 1024)
+
+    source_bytes = sum(x.source_bytes for x in worker_results)
+    upload_bytes = sum(x.upload_bytes for x in worker_results)
+    upload_sec = sum(x.upload_sec for x in worker_results)
+    cache_hits = sum(x.cache_hits for x in worker_results)
+    cache_misses = sum(x.cache_misses for x in worker_results)
 
-    rtf = sum(x.process_sec for x in results) / sum(x.audio_sec for x in results)
+    if cache_folder is not None:
+        print(f"Transcript cache: {cache_hits} hits, {cache_misses} misses")
 
-    results_log_path = os.path.join(RESULTS_FOLDER, language.value, dataset_type.value, f"{str(engine)}.log")
-    os.makedirs(os.path.dirname(results_log_path), exist_ok=True)
+    baseline_results = read_results_log(baseline_log_path) if results_log_path != baseline_log_path else dict()
+
+    os.makedirs(results_log_folder, exist_ok=True)
     with open(results_log_path, "w") as f:
         for metric_name, metric_results in metric_results.items():
-            num_errors = sum(x.num_errors for x in metric_results)
-            num_tokens = sum(x.num_tokens for x in metric_results)
+            num_errors = sum(x.num_errors[metric_name] for x in metric_results)
+            num_tokens = sum(x.num_tokens[metric_name] for x in metric_results)
+            if num_tokens == 0:
+                continue
             error_rate = 100 * float(num_errors) / num_tokens
 
             f.write(f"{metric_name}: {str(error_rate)}\n")
             print(f"{metric_name}: {error_rate:.2f}")
 
-        f.write(f"RTF: {str(rtf)}\n")
-        print(f"RTF: {rtf}")
+            if metric_name in baseline_results:
+                delta = error_rate - baseline_results[metric_name]
+                f.write(f"{metric_name} delta vs FLAC: {str(delta)}\n")
+                print(f"{metric_name} delta vs FLAC: {delta:+.2f}")
+
+        if rtf is not None:
+            f.write(f"RTF: {str(rtf)}\n")
+            print(f"RTF: {rtf}")
+
+        for name, value in timings.items():
+            f.write(f"{name}: {str(value)}\n")
+            print(f"{name}: {value:.3f}")
+
+        streaming_stats = [StreamingStats(**x.streaming) for x in results if x.streaming is not None]
+        for name, value in summarize(streaming_stats).items():
+            f.write(f"{name}: {str(value)}\n")
+            print(f"{name}: {value:.3f}")
+
+        if upload_bytes > 0:
+            f.write(f"Upload source bytes: {source_bytes}\n")
+            f.write(f"Upload bytes: {upload_bytes}\n")
+            print(f"Upload: {upload_bytes} / {source_bytes} bytes ({100 * upload_bytes / source_bytes:.1f}%)")
+        # Only engines that upload in a separate step (Amazon) can time the upload apart from recognition
+        if upload_sec > 0:
+            # Estimated assuming upload time scales linearly with the number of bytes sent
+            saved_sec = upload_sec * (source_bytes / upload_bytes - 1)
+            f.write(f"Upload sec: {str(upload_sec)}\n")
+            f.write(f"Upload sec saved: {str(saved_sec)}\n")
+            print(f"Upload time: {upload_sec:.1f} sec (estimated {saved_sec:.1f} sec saved)")
+
+        if len(results) < len(all_indices):
+            f.write(f"Completed: {len(results)}/{len(all_indices)}\n")
+
+    if profiler is not None:
+        profile_report_path = results_log_path.replace(".log", ".profile.txt")
+        modules = write_report(profiler, profile_folder, profile_report_path, args.flamegraph_output)
+        if modules is not None:
+            print("\n".join(format_modules(modules)))
+            print(f"Profile: {profile_report_path}")
+
+    if args.trace:
+        trace_path = results_log_path.replace(".log", ".trace.json")
+        stage_sec = merge_traces(trace_folder, trace_path)
+        for name, sec in sorted(stage_sec.items(), key=lambda x: -x[1]):
+            print(f"Trace {name}: {sec:.1f} sec")
+        print(f"Trace: {trace_path}")
+
+    utterance_table_path = results_log_path.replace(".log", f".{utterance_table_format.value}")
+    save_utterance_table(utterance_table_path, utterance_columns(results), utterance_table_format)
+    print(f"Per-utterance results: `{utterance_table_path}`")
+
+    if len(errors) > 0:
+        print(
+            f"Run stopped after {len(results)} of {len(all_indices)} examples, partial results written to "
+            f"`{results_log_path}`. Rerun with `--resume` to continue.",
+            file=sys.stderr,
+        )
+        raise errors[0]
 
 
 if __name__ == "__main__":
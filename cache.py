@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import sqlite3
+from collections import namedtuple
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence
+)
+
+import tracing
+
+CacheEntry = namedtuple("CacheEntry", ["transcript", "audio_sec", "process_sec"])
+
+ManifestGroup = namedtuple(
+    "ManifestGroup",
+    [
+        "engine",
+        "engine_name",
+        "params",
+        "dataset",
+        "language",
+        "punctuation",
+        "punctuation_set",
+        "results_log",
+        "dataset_folder",
+    ],
+)
+ManifestRow = namedtuple("ManifestRow", ["index", "audio_path", "audio_hash", "audio_sec", "reference"])
+ReplayRow = namedtuple("ReplayRow", ["index", "audio_sec", "process_sec", "reference", "transcript", "audio_path"])
+
+DEFAULT_CACHE_FOLDER = os.path.join(os.path.dirname(__file__), "cache")
+
+
+class TranscriptCache(object):
+    """
+    Content-addressed store of engine transcripts. Entries are keyed by the hash of the audio file, the engine and the
+    engine parameters (model, language, decoding settings, ...) so that a single SQLite file can be shared across
+    datasets and kept outside of (possibly read-only) dataset folders.
+    """
+
+    FILENAME = "transcripts.sqlite3"
+    MAX_QUERY_PARAMS = 500
+
+    def __init__(self, folder: str = DEFAULT_CACHE_FOLDER) -> None:
+        os.makedirs(folder, exist_ok=True)
+
+        self._connection = sqlite3.connect(os.path.join(folder, self.FILENAME), timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts ("
+            "audio_hash TEXT NOT NULL, "
+            "engine TEXT NOT NULL, "
+            "params TEXT NOT NULL, "
+            "transcript TEXT NOT NULL, "
+            "audio_sec REAL, "
+            "process_sec REAL, "
+            "PRIMARY KEY (audio_hash, engine, params))"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            "engine TEXT NOT NULL, "
+            "engine_name TEXT NOT NULL, "
+            "params TEXT NOT NULL, "
+            "dataset TEXT NOT NULL, "
+            "language TEXT NOT NULL, "
+            "punctuation INTEGER NOT NULL, "
+            "punctuation_set TEXT NOT NULL, "
+            "results_log TEXT NOT NULL, "
+            "dataset_folder TEXT NOT NULL, "
+            "run_id TEXT NOT NULL, "
+            "idx INTEGER NOT NULL, "
+            "audio_path TEXT NOT NULL, "
+            "audio_hash TEXT NOT NULL, "
+            "audio_sec REAL NOT NULL, "
+            "reference TEXT NOT NULL, "
+            "PRIMARY KEY (engine, params, dataset, language, punctuation, punctuation_set, idx))"
+        )
+        self._connection.commit()
+
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_imports = 0
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+                tracing.count("bytes read", len(block))
+        return h.hexdigest()
+
+    @staticmethod
+    def serialize_params(params: Mapping[str, Any]) -> str:
+        return json.dumps(params, sort_keys=True)
+
+    def get(self, audio_hash: str, engine: str, params: Mapping[str, Any]) -> Optional[CacheEntry]:
+        return self.get_many([audio_hash], engine, params).get(audio_hash)
+
+    def get_many(self, audio_hashes: Iterable[str], engine: str, params: Mapping[str, Any]) -> Dict[str, CacheEntry]:
+        audio_hashes = list(dict.fromkeys(audio_hashes))
+        serialized_params = self.serialize_params(params)
+
+        res = dict()
+        for i in range(0, len(audio_hashes), self.MAX_QUERY_PARAMS):
+            chunk = audio_hashes[i : i + self.MAX_QUERY_PARAMS]
+            rows = self._connection.execute(
+                "SELECT audio_hash, transcript, audio_sec, process_sec FROM transcripts "
+                f"WHERE engine = ? AND params = ? AND audio_hash IN ({','.join('?' * len(chunk))})",
+                [engine, serialized_params, *chunk],
+            )
+            for audio_hash, transcript, audio_sec, process_sec in rows:
+                res[audio_hash] = CacheEntry(transcript=transcript, audio_sec=audio_sec, process_sec=process_sec)
+
+        self._num_hits += len(res)
+        self._num_misses += len(audio_hashes) - len(res)
+
+        return res
+
+    def put(
+        self,
+        audio_hash: str,
+        engine: str,
+        params: Mapping[str, Any],
+        transcript: str,
+        audio_sec: Optional[float] = None,
+        process_sec: Optional[float] = None,
+    ) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?, ?)",
+            [audio_hash, engine, self.serialize_params(params), transcript, audio_sec, process_sec],
+        )
+        self._connection.commit()
+
+    def import_legacy(
+        self,
+        legacy_path: str,
+        audio_hash: str,
+        engine: str,
+        params: Mapping[str, Any],
+    ) -> Optional[CacheEntry]:
+        """Copies a transcript written next to the audio by older versions of the benchmark into the cache."""
+
+        if not os.path.exists(legacy_path):
+            return None
+
+        with open(legacy_path) as f:
+            transcript = f.read()
+
+        self.put(audio_hash, engine, params, transcript)
+        self._num_imports += 1
+
+        return CacheEntry(transcript=transcript, audio_sec=None, process_sec=None)
+
+    def record_manifest(self, group: ManifestGroup, run_id: str, rows: Sequence[ManifestRow]) -> None:
+        """
+        Records which utterances a run scored so that `replay.py` can rescore them without the engine. The utterances of
+        earlier runs of the group are dropped, the workers of a run all record under the same `run_id`.
+        """
+
+        self._connection.execute(
+            "DELETE FROM manifest WHERE engine = ? AND params = ? AND dataset = ? AND language = ? AND punctuation = ? "
+            "AND punctuation_set = ? AND run_id != ?",
+            [
+                group.engine,
+                group.params,
+                group.dataset,
+                group.language,
+                int(group.punctuation),
+                group.punctuation_set,
+                run_id,
+            ],
+        )
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                [
+                    group.engine,
+                    group.engine_name,
+                    group.params,
+                    group.dataset,
+                    group.language,
+                    int(group.punctuation),
+                    group.punctuation_set,
+                    group.results_log,
+                    group.dataset_folder,
+                    run_id,
+                    row.index,
+                    row.audio_path,
+                    row.audio_hash,
+                    row.audio_sec,
+                    row.reference,
+                ]
+                for row in rows
+            ],
+        )
+        self._connection.commit()
+
+    def manifest_groups(self) -> List[ManifestGroup]:
+        rows = self._connection.execute(
+            "SELECT DISTINCT engine, engine_name, params, dataset, language, punctuation, punctuation_set, results_log, "
+            "dataset_folder FROM manifest ORDER BY language, dataset, engine"
+        )
+        return [ManifestGroup(*row[:5], bool(row[5]), *row[6:]) for row in rows]
+
+    def replay_rows(self, group: ManifestGroup) -> List[ReplayRow]:
+        rows = self._connection.execute(
+            "SELECT m.idx, m.audio_sec, t.process_sec, m.reference, t.transcript, m.audio_path FROM manifest AS m "
+            "JOIN transcripts AS t ON t.audio_hash = m.audio_hash AND t.engine = m.engine_name AND t.params = m.params "
+            "WHERE m.engine = ? AND m.params = ? AND m.dataset = ? AND m.language = ? AND m.punctuation = ? "
+            "AND m.punctuation_set = ? ORDER BY m.idx",
+            [
+                group.engine,
+                group.params,
+                group.dataset,
+                group.language,
+                int(group.punctuation),
+                group.punctuation_set,
+            ],
+        )
+        return [ReplayRow(*row) for row in rows]
+
+    def num_hits(self) -> int:
+        return self._num_hits
+
+    def num_misses(self) -> int:
+        return self._num_misses
+
+    def num_imports(self) -> int:
+        return self._num_imports
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+__all__ = [
+    "CacheEntry",
+    "DEFAULT_CACHE_FOLDER",
+    "ManifestGroup",
+    "ManifestRow",
+    "ReplayRow",
+    "TranscriptCache",
+]
@@ -9,6 +9,7 @@ from typing import (
 
 import soundfile
 
+import tracing
 from languages import Languages
 from normalizer import Normalizer
 
@@ -108,6 +109,7 @@ class CommonVoiceDataset(Dataset):
                             "16000",
                             flac_path,
                         ]
+                        tracing.count("ffmpeg spawns")
                         subprocess.check_output(args)
                     elif soundfile.read(flac_path)[0].size > 16000 * 60:
                         continue
@@ -243,6 +245,7 @@ class TEDLIUMDataset(Dataset):
                                 f"{end_sec:.3f}",
                                 flac_path,
                             ]
+                            tracing.count("ffmpeg spawns")
                             subprocess.check_output(args)
 
                         self._data.append((flac_path, transcript))
@@ -283,6 +286,7 @@ class TEDLIUMDataset(Dataset):
                             "error",
                             flac_path,
                         ]
+                    tracing.count("ffmpeg spawns")
                     subprocess.check_output(args)
 
                 self._data.append((flac_path, full_transcript))
@@ -333,6 +337,7 @@ class MLSDataset(Dataset):
                         "16000",
                         flac_path,
                     ]
+                    tracing.count("ffmpeg spawns")
                     subprocess.check_output(args)
 
                 try:
@@ -395,6 +400,7 @@ class VoxPopuliDataset(Dataset):
                         "16000",
                         flac_path,
                     ]
+                    tracing.count("ffmpeg spawns")
                     subprocess.check_output(args)
                 elif soundfile.read(flac_path)[0].size > 16000 * 60:
                     continue
@@ -434,6 +440,7 @@ class VoxPopuliDataset(Dataset):
                         "16000",
                         flac_path,
                     ]
+                    tracing.count("ffmpeg spawns")
                     subprocess.check_output(args)
                 elif soundfile.read(flac_path)[0].size > 16000 * 60:
                     continue
@@ -503,6 +510,7 @@ class FleursDataset(Dataset):
                         "16000",
                         flac_path,
                     ]
+                    tracing.count("ffmpeg spawns")
                     subprocess.check_output(args)
                 elif soundfile.read(flac_path)[0].size > 16000 * 60:
                     continue
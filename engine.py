@@ -1,13 +1,27 @@
+import copy
+import io
+import itertools
 import json
 import os
+import subprocess
+import threading
 import time
 import uuid
 import warnings
+from contextlib import contextmanager
 from enum import Enum
-from typing import Optional
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple
+)
 
 import azure.cognitiveservices.speech as speechsdk
 import boto3
+import numpy as np
 import pvcheetah
 import pvleopard
 import requests
@@ -17,11 +31,23 @@ import whisper
 from google.cloud import speech
 from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
 from ibm_watson import SpeechToTextV1
+from numpy.typing import NDArray
 
+import tracing
+from cache import (
+    CacheEntry,
+    TranscriptCache
+)
 from languages import (
     LANGUAGE_TO_CODE,
     Languages
 )
+from streaming import (
+    StreamingClocks,
+    StreamingStats,
+    frames,
+    stream
+)
 
 warnings.filterwarnings("ignore", message="FP16 is not supported on CPU; using FP32 instead")
 warnings.filterwarnings("ignore", message="Performing inference on CPU when CUDA is available")
@@ -50,16 +76,247 @@ class Engines(Enum):
     PICOVOICE_LEOPARD = "PICOVOICE_LEOPARD"
 
 
+class UploadEncodings(Enum):
+    FLAC = "FLAC"
+    OGG_OPUS = "OGG_OPUS"
+
+
+class UploadEncoder(object):
+    """Prepares the audio payload that cloud engines send and keeps track of how many bytes it saves."""
+
+    def __init__(self, encoding: UploadEncodings = UploadEncodings.FLAC, bitrate_kbps: int = 32):
+        self._encoding = encoding
+        self._bitrate_kbps = bitrate_kbps
+        self._source_bytes = 0
+        self._upload_bytes = 0
+        self._upload_sec = 0.0
+
+    @property
+    def encoding(self) -> UploadEncodings:
+        return self._encoding
+
+    def cache_params(self) -> Dict[str, Any]:
+        if self._encoding is UploadEncodings.FLAC:
+            return {"upload_encoding": self._encoding.value}
+        return {"upload_encoding": self._encoding.value, "upload_bitrate_kbps": self._bitrate_kbps}
+
+    def encode(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            content = f.read()
+        self._source_bytes += len(content)
+        tracing.count("bytes read", len(content))
+
+        if self._encoding is UploadEncodings.OGG_OPUS:
+            args = [
+                "ffmpeg",
+                "-loglevel",
+                "error",
+                "-i",
+                path,
+                "-ac",
+                "1",
+                "-ar",
+                "16000",
+                "-c:a",
+                "libopus",
+                "-b:a",
+                f"{self._bitrate_kbps}k",
+                "-f",
+                "ogg",
+                "pipe:1",
+            ]
+            tracing.count("ffmpeg spawns")
+            with tracing.span("upload encode"):
+                content = subprocess.check_output(args)
+
+        self._upload_bytes += len(content)
+
+        return content
+
+    def add_upload_sec(self, sec: float) -> None:
+        self._upload_sec += sec
+
+    def source_bytes(self) -> int:
+        return self._source_bytes
+
+    def upload_bytes(self) -> int:
+        return self._upload_bytes
+
+    def upload_sec(self) -> float:
+        return self._upload_sec
+
+
+class TimingCounters(Enum):
+    DECODE = "DECODE"
+    PREPROCESS = "PREPROCESS"
+    INFERENCE = "INFERENCE"
+
+
 class Engine(object):
+    """
+    Local engines time their work with `_timed` so that every engine is measured on the same basis: reading and
+    decoding the audio file (`DECODE`), feature extraction where the engine exposes it separately (`PREPROCESS`), and
+    running the model (`INFERENCE`). `process_sec` is the inference time.
+    """
+
+    # Whether `transcribe` decodes the audio with `_read_audio`, so that decoding can happen ahead of time
+    DECODES_AUDIO = False
+
+    _cache: Optional[TranscriptCache] = None
+    _timings: Optional[Dict[TimingCounters, float]] = None
+    _preloaded_audio: Optional[Dict[str, Tuple[NDArray, int]]] = None
+    _provided_audio: Optional[Tuple[str, Tuple[NDArray, int], float]] = None
+    _upload_encoder: Optional[UploadEncoder] = None
+
     def transcribe(self, path: str) -> str:
         raise NotImplementedError()
 
+    def cache_params(self) -> Dict[str, Any]:
+        raise NotImplementedError()
+
+    def attach_cache(self, cache: Optional[TranscriptCache]) -> None:
+        self._cache = cache
+        self._cache_lookups: Dict[str, Tuple[str, Optional[CacheEntry]]] = dict()
+
+    def prefetch_cache(self, paths: Sequence[str]) -> None:
+        if self._cache is None:
+            return
+
+        audio_hashes = {path: TranscriptCache.hash_file(path) for path in paths}
+        entries = self._cache.get_many(audio_hashes.values(), str(self), self.cache_params())
+        for path, audio_hash in audio_hashes.items():
+            self._cache_lookups[path] = (audio_hash, entries.get(audio_hash))
+
+    def has_cached_transcript(self, path: str) -> bool:
+        """Whether `prefetch_cache` found a transcript that `transcribe` returns without reading the audio of `path`."""
+
+        if self._cache is None or path not in self._cache_lookups:
+            return False
+
+        return self._cache_lookups[path][1] is not None
+
+    def _cache_get(self, path: str, legacy_extension: Optional[str] = None) -> Optional[CacheEntry]:
+        if self._cache is None:
+            return None
+
+        with tracing.span("cache lookup"):
+            if path in self._cache_lookups:
+                audio_hash, entry = self._cache_lookups[path]
+            else:
+                audio_hash = TranscriptCache.hash_file(path)
+                entry = self._cache.get(audio_hash, str(self), self.cache_params())
+                self._cache_lookups[path] = (audio_hash, entry)
+
+            if entry is None and legacy_extension is not None:
+                entry = self._cache.import_legacy(
+                    path.replace(".flac", legacy_extension),
+                    audio_hash,
+                    str(self),
+                    self.cache_params(),
+                )
+
+        tracing.count("cache misses" if entry is None else "cache hits")
+        return entry
+
+    def _cache_put(
+        self,
+        path: str,
+        transcript: str,
+        audio_sec: Optional[float] = None,
+        process_sec: Optional[float] = None,
+    ) -> None:
+        if self._cache is None:
+            return
+
+        audio_hash = self.audio_hash(path)
+        self._cache.put(audio_hash, str(self), self.cache_params(), transcript, audio_sec, process_sec)
+        self._cache_lookups[path] = (audio_hash, CacheEntry(transcript, audio_sec, process_sec))
+
+    def audio_hash(self, path: str) -> Optional[str]:
+        if self._cache is None:
+            return None
+
+        if path in self._cache_lookups:
+            return self._cache_lookups[path][0]
+
+        return TranscriptCache.hash_file(path)
+
+    def preload_audio(self, paths: Sequence[str]) -> None:
+        """Decodes the audio files into memory so that later `transcribe` calls on them spend no time decoding."""
+
+        if self._preloaded_audio is None:
+            self._preloaded_audio = dict()
+        for path in paths:
+            tracing.count("bytes read", os.path.getsize(path))
+            self._preloaded_audio[path] = soundfile.read(path, dtype="int16")
+
+    def provide_audio(self, path: str, audio: NDArray, sample_rate: int, decode_sec: float) -> None:
+        """Hands over audio decoded elsewhere for the next `transcribe` call, which counts `decode_sec` as decoding."""
+
+        self._provided_audio = (path, (audio, sample_rate), decode_sec)
+
+    def discard_provided_audio(self) -> None:
+        """Drops audio handed over with `provide_audio` that `transcribe` did not use, e.g. because of a cache hit."""
+
+        self._provided_audio = None
+
+    def _read_audio(self, path: str) -> Tuple[NDArray, int]:
+        if self._preloaded_audio is not None and path in self._preloaded_audio:
+            return self._preloaded_audio[path]
+
+        if self._provided_audio is not None and self._provided_audio[0] == path:
+            _, res, decode_sec = self._provided_audio
+            self._provided_audio = None
+            self._add_timing(TimingCounters.DECODE, decode_sec)
+            return res
+
+        tracing.count("bytes read", os.path.getsize(path))
+        with self._timed(TimingCounters.DECODE):
+            return soundfile.read(path, dtype="int16")
+
+    def _add_timing(self, counter: TimingCounters, sec: float) -> None:
+        if self._timings is None:
+            self._timings = {x: 0.0 for x in TimingCounters}
+        self._timings[counter] += sec
+
+    @contextmanager
+    def _timed(self, counter: TimingCounters) -> Iterator[None]:
+        start_sec = time.perf_counter()
+        try:
+            with tracing.span(counter.value.lower()):
+                yield
+        finally:
+            self._add_timing(counter, time.perf_counter() - start_sec)
+
+    def timings(self) -> Dict[TimingCounters, float]:
+        """Seconds spent so far in each stage. Transcripts served from the cache do not count."""
+
+        if self._timings is None:
+            return {x: 0.0 for x in TimingCounters}
+        return dict(self._timings)
+
     def audio_sec(self) -> float:
         raise NotImplementedError()
 
     def process_sec(self) -> float:
         raise NotImplementedError()
 
+    def source_bytes(self) -> int:
+        return self._upload_encoder.source_bytes() if self._upload_encoder is not None else 0
+
+    def upload_bytes(self) -> int:
+        return self._upload_encoder.upload_bytes() if self._upload_encoder is not None else 0
+
+    def upload_sec(self) -> float:
+        """Time spent only sending audio, for engines that upload it in a step of its own."""
+
+        return self._upload_encoder.upload_sec() if self._upload_encoder is not None else 0.0
+
+    def last_streaming_stats(self) -> Optional[StreamingStats]:
+        """Latency statistics of the last `transcribe` call for engines running in a streaming mode."""
+
+        return None
+
     def delete(self) -> None:
         raise NotImplementedError()
 
@@ -69,27 +326,27 @@ class Engine(object):
     @classmethod
     def create(cls, x: Engines, language: Languages, **kwargs):
         if x is Engines.AMAZON_TRANSCRIBE:
-            return AmazonTranscribeEngine(language=language)
+            return AmazonTranscribeEngine(language=language, **kwargs)
         elif x is Engines.AZURE_SPEECH_TO_TEXT:
             return AzureSpeechToTextEngine(language=language, **kwargs)
         elif x is Engines.GOOGLE_SPEECH_TO_TEXT:
-            return GoogleSpeechToTextEngine(language=language)
+            return GoogleSpeechToTextEngine(language=language, **kwargs)
         elif x is Engines.GOOGLE_SPEECH_TO_TEXT_ENHANCED:
-            return GoogleSpeechToTextEnhancedEngine(language=language)
+            return GoogleSpeechToTextEnhancedEngine(language=language, **kwargs)
         elif x is Engines.WHISPER_TINY:
-            return WhisperTiny(language=language)
+            return WhisperTiny(language=language, **kwargs)
         elif x is Engines.WHISPER_BASE:
-            return WhisperBase(language=language)
+            return WhisperBase(language=language, **kwargs)
         elif x is Engines.WHISPER_SMALL:
-            return WhisperSmall(language=language)
+            return WhisperSmall(language=language, **kwargs)
         elif x is Engines.WHISPER_MEDIUM:
-            return WhisperMedium(language=language)
+            return WhisperMedium(language=language, **kwargs)
         elif x is Engines.WHISPER_LARGE:
-            return WhisperLarge(language=language)
+            return WhisperLarge(language=language, **kwargs)
         elif x is Engines.WHISPER_LARGE_V2:
-            return WhisperLargeV2(language=language)
+            return WhisperLargeV2(language=language, **kwargs)
         elif x is Engines.WHISPER_LARGE_V3:
-            return WhisperLargeV3(language=language)
+            return WhisperLargeV3(language=language, **kwargs)
         elif x is Engines.PICOVOICE_CHEETAH:
             return PicovoiceCheetahEngine(**kwargs)
         elif x is Engines.PICOVOICE_LEOPARD:
@@ -101,8 +358,9 @@ class Engine(object):
 
 
 class AmazonTranscribeEngine(Engine):
-    def __init__(self, language: Languages):
+    def __init__(self, language: Languages, upload_encoder: Optional[UploadEncoder] = None):
         self._language_code = LANGUAGE_TO_CODE[language]
+        self._upload_encoder = upload_encoder if upload_encoder is not None else UploadEncoder()
 
         self._s3_client = boto3.client("s3")
         self._s3_bucket = str(uuid.uuid4())
@@ -115,21 +373,27 @@ class AmazonTranscribeEngine(Engine):
         self._transcribe_client = boto3.client("transcribe")
 
     def transcribe(self, path: str) -> str:
-        cache_path = path.replace(".flac", ".aws")
+        legacy_extension = ".aws" if self._upload_encoder.encoding is UploadEncodings.FLAC else None
+        entry = self._cache_get(path, legacy_extension=legacy_extension)
+        if entry is not None:
+            return entry.transcript
 
-        if os.path.exists(cache_path):
-            with open(cache_path) as f:
-                res = f.read()
-            return res
+        if self._upload_encoder.encoding is UploadEncodings.OGG_OPUS:
+            media_format = "ogg"
+        else:
+            media_format = "flac"
 
         job_name = str(uuid.uuid4())
-        s3_object = os.path.basename(path)
-        self._s3_client.upload_file(path, self._s3_bucket, s3_object)
+        s3_object = os.path.basename(path).replace(".flac", f".{media_format}")
+        content = self._upload_encoder.encode(path)
+        start_sec = time.time()
+        self._s3_client.upload_fileobj(io.BytesIO(content), self._s3_bucket, s3_object)
+        self._upload_encoder.add_upload_sec(time.time() - start_sec)
 
         self._transcribe_client.start_transcription_job(
             TranscriptionJobName=job_name,
             Media={"MediaFileUri": f"https://s3-us-west-2.amazonaws.com/{self._s3_bucket}/{s3_object}"},
-            MediaFormat="flac",
+            MediaFormat=media_format,
             LanguageCode=self._language_code,
         )
 
@@ -147,11 +411,13 @@ class AmazonTranscribeEngine(Engine):
 
         res = json.loads(content.content.decode("utf8"))["results"]["transcripts"][0]["transcript"]
 
-        with open(cache_path, "w") as f:
-            f.write(res)
+        self._cache_put(path, res)
 
         return res
 
+    def cache_params(self) -> Dict[str, Any]:
+        return {"language": self._language_code, **self._upload_encoder.cache_params()}
+
     def audio_sec(self) -> float:
         return -1.0
 
@@ -185,12 +451,9 @@ class AzureSpeechToTextEngine(Engine):
         self._azure_speech_location = azure_speech_location
 
     def transcribe(self, path: str) -> str:
-        cache_path = path.replace(".flac", ".ms")
-
-        if os.path.exists(cache_path):
-            with open(cache_path, "r") as f:
-                res = f.read()
-            return res
+        entry = self._cache_get(path, legacy_extension=".ms")
+        if entry is not None:
+            return entry.transcript
 
         wav_path = path.replace(".flac", ".wav")
         soundfile.write(
@@ -235,11 +498,13 @@ class AzureSpeechToTextEngine(Engine):
 
         os.remove(wav_path)
 
-        with open(cache_path, "w") as f:
-            f.write(res)
+        self._cache_put(path, res)
 
         return res
 
+    def cache_params(self) -> Dict[str, Any]:
+        return {"language": self._language_code}
+
     def audio_sec(self) -> float:
         return -1.0
 
@@ -259,13 +524,21 @@ class GoogleSpeechToTextEngine(Engine):
         language: Languages,
         cache_extension: str = ".ggl",
         model: Optional[str] = None,
+        upload_encoder: Optional[UploadEncoder] = None,
     ):
         self._language_code = LANGUAGE_TO_CODE[language]
+        self._upload_encoder = upload_encoder if upload_encoder is not None else UploadEncoder()
 
         self._client = speech.SpeechClient()
 
+        if self._upload_encoder.encoding is UploadEncodings.OGG_OPUS:
+            encoding = speech.RecognitionConfig.AudioEncoding.OGG_OPUS
+        else:
+            encoding = speech.RecognitionConfig.AudioEncoding.FLAC
+
+        self._model = model
         self._config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.FLAC,
+            encoding=encoding,
             sample_rate_hertz=16000,
             language_code=self._language_code,
             model=model,
@@ -275,14 +548,12 @@ class GoogleSpeechToTextEngine(Engine):
         self._cache_extension = cache_extension
 
     def transcribe(self, path: str) -> str:
-        cache_path = path.replace(".flac", self._cache_extension)
-        if os.path.exists(cache_path):
-            with open(cache_path) as f:
-                res = f.read()
-            return res
+        legacy_extension = self._cache_extension if self._upload_encoder.encoding is UploadEncodings.FLAC else None
+        entry = self._cache_get(path, legacy_extension=legacy_extension)
+        if entry is not None:
+            return entry.transcript
 
-        with open(path, "rb") as f:
-            content = f.read()
+        content = self._upload_encoder.encode(path)
 
         audio = speech.RecognitionAudio(content=content)
 
@@ -290,11 +561,13 @@ class GoogleSpeechToTextEngine(Engine):
 
         res = " ".join(result.alternatives[0].transcript for result in response.results)
 
-        with open(cache_path, "w") as f:
-            f.write(res)
+        self._cache_put(path, res)
 
         return res
 
+    def cache_params(self) -> Dict[str, Any]:
+        return {"language": self._language_code, "model": self._model, **self._upload_encoder.cache_params()}
+
     def audio_sec(self) -> float:
         return -1.0
 
@@ -309,10 +582,10 @@ class GoogleSpeechToTextEngine(Engine):
 
 
 class GoogleSpeechToTextEnhancedEngine(GoogleSpeechToTextEngine):
-    def __init__(self, language: Languages):
+    def __init__(self, language: Languages, upload_encoder: Optional[UploadEncoder] = None):
         if language != Languages.EN:
             raise ValueError("GOOGLE_SPEECH_TO_TEXT_ENHANCED engine only supports EN language")
-        super().__init__(language=language, cache_extension=".ggle", model="video")
+        super().__init__(language=language, cache_extension=".ggle", model="video", upload_encoder=upload_encoder)
 
     def __str__(self) -> str:
         return "Google Speech-to-Text Enhanced"
@@ -324,37 +597,47 @@ class IBMWatsonSpeechToTextEngine(Engine):
         watson_speech_to_text_api_key: str,
         watson_speech_to_text_url: str,
         language: Languages,
+        upload_encoder: Optional[UploadEncoder] = None,
     ):
         if language != Languages.EN:
             raise ValueError("IBM_WATSON_SPEECH_TO_TEXT engine only supports EN language")
 
+        self._upload_encoder = upload_encoder if upload_encoder is not None else UploadEncoder()
+
         self._service = SpeechToTextV1(authenticator=IAMAuthenticator(watson_speech_to_text_api_key))
         self._service.set_service_url(watson_speech_to_text_url)
 
     def transcribe(self, path: str) -> str:
-        cache_path = path.replace(".flac", ".ibm")
-        if os.path.exists(cache_path):
-            with open(cache_path, "r") as f:
-                res = f.read()
-            return res
+        legacy_extension = ".ibm" if self._upload_encoder.encoding is UploadEncodings.FLAC else None
+        entry = self._cache_get(path, legacy_extension=legacy_extension)
+        if entry is not None:
+            return entry.transcript
 
-        with open(path, "rb") as f:
-            response = self._service.recognize(
-                audio=f,
-                content_type="audio/flac",
-                smart_formatting=True,
-                end_of_phrase_silence_time=15,
-            ).get_result()
+        if self._upload_encoder.encoding is UploadEncodings.OGG_OPUS:
+            content_type = "audio/ogg;codecs=opus"
+        else:
+            content_type = "audio/flac"
+
+        content = self._upload_encoder.encode(path)
+
+        response = self._service.recognize(
+            audio=io.BytesIO(content),
+            content_type=content_type,
+            smart_formatting=True,
+            end_of_phrase_silence_time=15,
+        ).get_result()
 
         res = ""
         if response and ("results" in response) and response["results"]:
             res = response["results"][0]["alternatives"][0]["transcript"]
 
-        with open(cache_path, "w") as f:
-            f.write(res)
+        self._cache_put(path, res)
 
         return res
 
+    def cache_params(self) -> Dict[str, Any]:
+        return {"language": LANGUAGE_TO_CODE[Languages.EN], **self._upload_encoder.cache_params()}
+
     def audio_sec(self) -> float:
         return -1.0
 
@@ -369,6 +652,7 @@ class IBMWatsonSpeechToTextEngine(Engine):
 
 
 class Whisper(Engine):
+    DECODES_AUDIO = True
     SAMPLE_RATE = 16000
 
     LANGUAGE_TO_WHISPER_CODE = {
@@ -381,33 +665,68 @@ class Whisper(Engine):
         Languages.PT_BR: "pt",
     }
 
-    def __init__(self, cache_extension: str, model: str, language: Languages):
-        self._model = whisper.load_model(model, device="cpu")
+    _shared_models: Dict[str, Any] = dict()
+    _shared_models_lock = threading.Lock()
+
+    def __init__(self, cache_extension: str, model: str, language: Languages, share_model: bool = False):
+        if share_model:
+            self._model = self._shared_model(model)
+        else:
+            self._model = whisper.load_model(model, device="cpu")
+        self._model_name = model
         self._cache_extension = cache_extension
         self._language_code = self.LANGUAGE_TO_WHISPER_CODE[language]
         self._audio_sec = 0.0
         self._proc_sec = 0.0
 
     def transcribe(self, path: str) -> str:
-        audio, sample_rate = soundfile.read(path, dtype="int16")
+        entry = self._cache_get(path, legacy_extension=self._cache_extension)
+        if entry is not None and entry.audio_sec is not None:
+            self._audio_sec += entry.audio_sec
+            self._proc_sec += entry.process_sec
+            return entry.transcript
+
+        audio, sample_rate = self._read_audio(path)
         assert sample_rate == self.SAMPLE_RATE
-        self._audio_sec += audio.size / sample_rate
+        audio_sec = audio.size / sample_rate
+        self._audio_sec += audio_sec
 
-        cache_path = path.replace(".flac", self._cache_extension)
-        if os.path.exists(cache_path):
-            with open(cache_path) as f:
-                res = f.read()
-            return res
+        if entry is not None:
+            return entry.transcript
 
-        start_sec = time.time()
-        res = self._model.transcribe(path, language=self._language_code)["text"]
-        self._proc_sec += time.time() - start_sec
+        # Equivalent to the ffmpeg decode `transcribe` runs when given a path. The log-Mel spectrogram is computed
+        # inside `transcribe` and is therefore part of the inference time.
+        with self._timed(TimingCounters.PREPROCESS):
+            samples = audio.astype(np.float32) / 32768.0
+
+        start_sec = time.perf_counter()
+        with self._timed(TimingCounters.INFERENCE):
+            res = self._model.transcribe(samples, language=self._language_code)["text"]
+        process_sec = time.perf_counter() - start_sec
+        self._proc_sec += process_sec
 
-        with open(cache_path, "w") as f:
-            f.write(res)
+        self._cache_put(path, res, audio_sec=audio_sec, process_sec=process_sec)
 
         return res
 
+    @classmethod
+    def _shared_model(cls, model: str) -> Any:
+        """
+        Loads the weights of `model` once per process. Every caller gets its own module tree over the shared parameters,
+        since decoding installs key/value cache hooks on the modules and concurrent calls must not see each other's.
+        """
+
+        with cls._shared_models_lock:
+            if model not in cls._shared_models:
+                cls._shared_models[model] = whisper.load_model(model, device="cpu")
+            shared = cls._shared_models[model]
+
+        memo = {id(x): x for x in itertools.chain(shared.parameters(), shared.buffers())}
+        return copy.deepcopy(shared, memo)
+
+    def cache_params(self) -> Dict[str, Any]:
+        return {"model": self._model_name, "language": self._language_code}
+
     def audio_sec(self) -> float:
         return self._audio_sec
 
@@ -422,72 +741,75 @@ class Whisper(Engine):
 
 
 class WhisperTiny(Whisper):
-    def __init__(self, language: Languages):
+    def __init__(self, language: Languages, share_model: bool = False):
         model = "tiny.en" if language == Languages.EN else "tiny"
-        super().__init__(cache_extension=".wspt", model=model, language=language)
+        super().__init__(cache_extension=".wspt", model=model, language=language, share_model=share_model)
 
     def __str__(self) -> str:
         return "Whisper Tiny"
 
 
 class WhisperBase(Whisper):
-    def __init__(self, language: Languages):
+    def __init__(self, language: Languages, share_model: bool = False):
         model = "base.en" if language == Languages.EN else "base"
-        super().__init__(cache_extension=".wspb", model=model, language=language)
+        super().__init__(cache_extension=".wspb", model=model, language=language, share_model=share_model)
 
     def __str__(self) -> str:
         return "Whisper Base"
 
 
 class WhisperSmall(Whisper):
-    def __init__(self, language: Languages):
+    def __init__(self, language: Languages, share_model: bool = False):
         model = "small.en" if language == Languages.EN else "small"
-        super().__init__(cache_extension=".wsps", model=model, language=language)
+        super().__init__(cache_extension=".wsps", model=model, language=language, share_model=share_model)
 
     def __str__(self) -> str:
         return "Whisper Small"
 
 
 class WhisperMedium(Whisper):
-    def __init__(self, language: Languages):
+    def __init__(self, language: Languages, share_model: bool = False):
         model = "medium.en" if language == Languages.EN else "medium"
-        super().__init__(cache_extension=".wspm", model=model, language=language)
+        super().__init__(cache_extension=".wspm", model=model, language=language, share_model=share_model)
 
     def __str__(self) -> str:
         return "Whisper Medium"
 
 
 class WhisperLarge(Whisper):
-    def __init__(self, language: Languages):
-        super().__init__(cache_extension=".wspl", model="large-v1", language=language)
+    def __init__(self, language: Languages, share_model: bool = False):
+        super().__init__(cache_extension=".wspl", model="large-v1", language=language, share_model=share_model)
 
     def __str__(self) -> str:
         return "Whisper Large-v1"
 
 
 class WhisperLargeV2(Whisper):
-    def __init__(self, language: Languages):
-        super().__init__(cache_extension=".wspl2", model="large-v2", language=language)
+    def __init__(self, language: Languages, share_model: bool = False):
+        super().__init__(cache_extension=".wspl2", model="large-v2", language=language, share_model=share_model)
 
     def __str__(self) -> str:
         return "Whisper Large-v2"
 
 
 class WhisperLargeV3(Whisper):
-    def __init__(self, language: Languages):
-        super().__init__(cache_extension=".wspl3", model="large-v3", language=language)
+    def __init__(self, language: Languages, share_model: bool = False):
+        super().__init__(cache_extension=".wspl3", model="large-v3", language=language, share_model=share_model)
 
     def __str__(self) -> str:
         return "Whisper Large-v3"
 
 
 class PicovoiceCheetahEngine(Engine):
+    DECODES_AUDIO = True
+
     def __init__(
         self,
         access_key: str,
         model_path: Optional[str],
         library_path: Optional[str],
         punctuation: bool = False,
+        streaming_clock: Optional[StreamingClocks] = None,
     ):
         self._cheetah = pvcheetah.create(
             access_key=access_key,
@@ -495,32 +817,58 @@ class PicovoiceCheetahEngine(Engine):
             library_path=library_path,
             enable_automatic_punctuation=punctuation,
         )
+        self._model = TranscriptCache.hash_file(model_path) if model_path is not None else None
+        self._punctuation = punctuation
+        self._streaming_clock = streaming_clock
+        self._last_streaming_stats = None
         self._audio_sec = 0.0
         self._proc_sec = 0.0
 
+    def has_cached_transcript(self, path: str) -> bool:
+        return self._streaming_clock is None and super().has_cached_transcript(path)
+
     def transcribe(self, path: str) -> str:
-        audio, sample_rate = soundfile.read(path, dtype="int16")
+        # Latencies can only be measured by running the engine
+        entry = self._cache_get(path) if self._streaming_clock is None else None
+        if entry is not None:
+            self._audio_sec += entry.audio_sec
+            self._proc_sec += entry.process_sec
+            return entry.transcript
+
+        audio, sample_rate = self._read_audio(path)
         assert sample_rate == self._cheetah.sample_rate
-        self._audio_sec += audio.size / sample_rate
+        audio_sec = audio.size / sample_rate
+        self._audio_sec += audio_sec
 
-        start_sec = time.time()
-        res = ""
-        for i in range(audio.size // self._cheetah.frame_length):
-            partial, _ = self._cheetah.process(
-                audio[i * self._cheetah.frame_length : (i + 1) * self._cheetah.frame_length]
-            )
-            res += partial
-        res += self._cheetah.flush()
-        self._proc_sec += time.time() - start_sec
+        if self._streaming_clock is not None:
+            res, self._last_streaming_stats = stream(self._cheetah, audio, self._streaming_clock)
+            process_sec = sum(self._last_streaming_stats.frame_sec) + self._last_streaming_stats.flush_sec
+            self._add_timing(TimingCounters.INFERENCE, process_sec)
+        else:
+            start_sec = time.perf_counter()
+            with self._timed(TimingCounters.INFERENCE):
+                partials = [self._cheetah.process(frame)[0] for frame in frames(audio, self._cheetah.frame_length)]
+                partials.append(self._cheetah.flush())
+            res = "".join(partials)
+            process_sec = time.perf_counter() - start_sec
+        self._proc_sec += process_sec
+
+        self._cache_put(path, res, audio_sec=audio_sec, process_sec=process_sec)
 
         return res
 
+    def cache_params(self) -> Dict[str, Any]:
+        return {"version": self._cheetah.version, "model": self._model, "punctuation": self._punctuation}
+
     def audio_sec(self) -> float:
         return self._audio_sec
 
     def process_sec(self) -> float:
         return self._proc_sec
 
+    def last_streaming_stats(self) -> Optional[StreamingStats]:
+        return self._last_streaming_stats
+
     def delete(self) -> None:
         self._cheetah.delete()
 
@@ -529,6 +877,8 @@ class PicovoiceCheetahEngine(Engine):
 
 
 class PicovoiceLeopardEngine(Engine):
+    DECODES_AUDIO = True
+
     def __init__(
         self,
         access_key: str,
@@ -542,20 +892,36 @@ class PicovoiceLeopardEngine(Engine):
             library_path=library_path,
             enable_automatic_punctuation=punctuation,
         )
+        self._model = TranscriptCache.hash_file(model_path) if model_path is not None else None
+        self._punctuation = punctuation
         self._audio_sec = 0.0
         self._proc_sec = 0.0
 
     def transcribe(self, path: str) -> str:
-        audio, sample_rate = soundfile.read(path, dtype="int16")
+        entry = self._cache_get(path)
+        if entry is not None:
+            self._audio_sec += entry.audio_sec
+            self._proc_sec += entry.process_sec
+            return entry.transcript
+
+        audio, sample_rate = self._read_audio(path)
         assert sample_rate == self._leopard.sample_rate
-        self._audio_sec += audio.size / sample_rate
+        audio_sec = audio.size / sample_rate
+        self._audio_sec += audio_sec
 
-        start_sec = time.time()
-        res = self._leopard.process(audio)
-        self._proc_sec += time.time() - start_sec
+        start_sec = time.perf_counter()
+        with self._timed(TimingCounters.INFERENCE):
+            res = self._leopard.process(audio)
+        process_sec = time.perf_counter() - start_sec
+        self._proc_sec += process_sec
+
+        self._cache_put(path, res[0], audio_sec=audio_sec, process_sec=process_sec)
 
         return res[0]
 
+    def cache_params(self) -> Dict[str, Any]:
+        return {"version": self._leopard.version, "model": self._model, "punctuation": self._punctuation}
+
     def audio_sec(self) -> float:
         return self._audio_sec
 
@@ -572,4 +938,7 @@ class PicovoiceLeopardEngine(Engine):
 __all__ = [
     "Engine",
     "Engines",
+    "TimingCounters",
+    "UploadEncoder",
+    "UploadEncodings",
 ]
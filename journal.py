@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import uuid
+from collections import namedtuple
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Sequence
+)
+
+# Fields after `process_sec` default to `None` so that journals written by earlier versions still load
+UtteranceResult = namedtuple(
+    "UtteranceResult",
+    [
+        "index",
+        "num_errors",
+        "num_tokens",
+        "audio_sec",
+        "process_sec",
+        "audio_path",
+        "duration_sec",
+        "num_reference_words",
+        "num_transcript_words",
+        "streaming",
+        "warmup",
+        "timings",
+    ],
+    defaults=[None, None, None, None, None, None, None],
+)
+
+
+class Journal(object):
+    """
+    Durable record of per-utterance results. Every worker appends to its own JSON lines file inside the journal folder
+    and syncs each line to disk so that a crashed or interrupted run can be resumed and aggregated.
+    """
+
+    INDICES_FILENAME = "indices.json"
+    RUN_ID_FILENAME = "run_id"
+
+    def __init__(self, folder: str) -> None:
+        os.makedirs(folder, exist_ok=True)
+        self._file = open(os.path.join(folder, f"{uuid.uuid4().hex}.jsonl"), "a")
+
+    def append(self, result: UtteranceResult) -> None:
+        self._file.write(json.dumps(result._asdict()) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+    @staticmethod
+    def clear(folder: str) -> None:
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+    @classmethod
+    def save_indices(cls, folder: str, indices: Sequence[int]) -> None:
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, cls.INDICES_FILENAME), "w") as f:
+            json.dump(list(indices), f)
+
+    @classmethod
+    def load_indices(cls, folder: str) -> Optional[List[int]]:
+        path = os.path.join(folder, cls.INDICES_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    @classmethod
+    def run_id(cls, folder: str) -> str:
+        """Identifies the run that the journal belongs to, the same across resumes until the journal is cleared."""
+
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, cls.RUN_ID_FILENAME)
+        if not os.path.exists(path):
+            with open(path, "w") as f:
+                f.write(uuid.uuid4().hex)
+        with open(path) as f:
+            return f.read().strip()
+
+    @staticmethod
+    def load(folder: str) -> Dict[int, UtteranceResult]:
+        res = dict()
+        if not os.path.exists(folder):
+            return res
+
+        for x in sorted(os.listdir(folder)):
+            if not x.endswith(".jsonl"):
+                continue
+            with open(os.path.join(folder, x)) as f:
+                for line in f:
+                    try:
+                        result = UtteranceResult(**json.loads(line))
+                    except (ValueError, TypeError):
+                        # The last line of a worker that was killed mid-write may be truncated
+                        continue
+                    res[result.index] = result
+
+        return res
+
+
+__all__ = [
+    "Journal",
+    "UtteranceResult",
+]
@@ -0,0 +1,63 @@
+import sys
+from typing import (
+    Any,
+    Dict
+)
+
+import psutil
+
+from engine import (
+    Engine,
+    Engines
+)
+from languages import Languages
+
+
+def current_rss_bytes() -> int:
+    return psutil.Process().memory_info().rss
+
+
+def peak_rss_bytes() -> int:
+    info = psutil.Process().memory_info()
+    # Windows keeps the peak working set itself
+    if hasattr(info, "peak_wset"):
+        return info.peak_wset
+
+    import resource
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS and kilobytes everywhere else
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def available_memory_bytes() -> int:
+    """Memory that can be allocated without swapping, including reclaimable caches."""
+
+    return psutil.virtual_memory().available
+
+
+def measure_engine_footprint(engine_name: Engines, language: Languages, engine_params: Dict[str, Any]) -> int:
+    """
+    Resident memory of a fresh process after creating one engine, including the interpreter and the imported
+    libraries. Run it in a process of its own so that the measurement starts from a clean heap.
+    """
+
+    engine = Engine.create(engine_name, language=language, **engine_params)
+    res = max(current_rss_bytes(), peak_rss_bytes())
+    engine.delete()
+    return res
+
+
+def auto_num_workers(footprint_bytes: int, headroom: float, max_workers: int) -> int:
+    """Number of workers of `footprint_bytes` each that fit in `headroom` of the available memory, at least one."""
+
+    return max(1, min(max_workers, int(headroom * available_memory_bytes() / max(footprint_bytes, 1))))
+
+
+__all__ = [
+    "auto_num_workers",
+    "available_memory_bytes",
+    "current_rss_bytes",
+    "measure_engine_footprint",
+    "peak_rss_bytes",
+]
@@ -1,9 +1,14 @@
+import math
 import re
 from enum import Enum
+from functools import lru_cache
 from typing import (
+    Dict,
     List,
+    Optional,
     Sequence,
-    Tuple
+    Tuple,
+    Union
 )
 
 import editdistance
@@ -16,76 +21,284 @@ from normalizer import SUPPORTED_PUNCTUATION_SET
 class Metrics(Enum):
     WER = "WER"
     PER = "PER"
+    CER = "CER"
+    ALL = "ALL"
 
 
 class Metric:
     def calculate(self, prediction: str, reference: str) -> Tuple[int, int]:
         raise NotImplementedError()
 
+    def calculate_many(
+        self, predictions: Sequence[str], references: Sequence[str]
+    ) -> Tuple[List[Tuple[int, int]], Tuple[int, int]]:
+        """Scores a batch of pairs and returns the `(num_errors, num_tokens)` of every pair and of the whole batch."""
+
+        calculate = self.calculate
+        res = [calculate(prediction=p, reference=r) for p, r in zip(predictions, references)]
+
+        return res, (sum(x[0] for x in res), sum(x[1] for x in res))
+
     @classmethod
     def create(cls, x: Metrics):
         if x is Metrics.WER:
             return WordErrorRate()
         elif x is Metrics.PER:
             return PunctuationErrorRate()
+        elif x is Metrics.CER:
+            return CharacterErrorRate()
+        elif x is Metrics.ALL:
+            return SharedAlignment()
         else:
             raise ValueError(f"Cannot create {cls.__name__} of type `{x}`")
 
 
 class WordErrorRate(Metric):
     def calculate(self, prediction: str, reference: str) -> Tuple[int, int]:
-        pred_tokens = prediction.split()
         ref_tokens = reference.split()
+        if prediction == reference:
+            return 0, len(ref_tokens)
+
+        pred_tokens = prediction.split()
 
+        # `editdistance` already runs Hyyrö's bit-parallel algorithm in C++
         error_count = editdistance.eval(ref_tokens, pred_tokens)
         token_count = len(ref_tokens)
 
         return error_count, token_count
 
+    @staticmethod
+    def align(prediction: str, reference: str) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        Returns the `(reference word, transcript word)` pairs of a minimum edit distance alignment in order. Deleted
+        words are paired with `None` on the transcript side and inserted words with `None` on the reference side.
+        """
+
+        ref_tokens = reference.split()
+        pred_tokens = prediction.split()
+        if ref_tokens == pred_tokens:
+            return [(x, x) for x in ref_tokens]
+
+        alignment = PunctuationErrorRate._alignment(reference=ref_tokens, prediction=pred_tokens)
+
+        res = list()
+        j = 0
+        for i, ref_token in enumerate(ref_tokens):
+            if i in alignment:
+                res.extend((None, x) for x in pred_tokens[j : alignment[i]])
+                j = alignment[i] + 1
+                res.append((ref_token, pred_tokens[j - 1]))
+            else:
+                res.append((ref_token, None))
+        res.extend((None, x) for x in pred_tokens[j:])
+
+        return res
+
+
+class CharacterErrorRate(Metric):
+    def calculate(self, prediction: str, reference: str) -> Tuple[int, int]:
+        ref_chars = " ".join(reference.split())
+        if prediction == reference:
+            return 0, len(ref_chars)
+
+        pred_chars = " ".join(prediction.split())
+
+        error_count = editdistance.eval(ref_chars, pred_chars)
+        token_count = len(ref_chars)
+
+        return error_count, token_count
+
+
+class BandedMatrix(object):
+    """
+    Edit distance matrix that only stores the cells within `width` of the main diagonal. Cells outside the band read as
+    `inf`, which is larger than any value inside the band.
+    """
+
+    def __init__(self, band: NDArray, width: int, inf: int) -> None:
+        self._band = band
+        self._width = width
+        self._inf = inf
+
+    def __getitem__(self, index: Tuple[int, int]) -> int:
+        i, j = index
+        k = j - i + self._width
+        if k < 0 or k >= self._band.shape[1]:
+            return self._inf
+        return int(self._band[i, k])
+
+
+class RowBlock(object):
+    """Consecutive rows of an edit distance matrix, starting at row `first_row`, indexed like the full matrix."""
+
+    def __init__(self, rows: NDArray, first_row: int) -> None:
+        self._rows = rows
+        self._first_row = first_row
+
+    def __getitem__(self, index: Tuple[int, int]) -> int:
+        i, j = index
+        return int(self._rows[i - self._first_row, j])
+
 
 class PunctuationErrorRate(Metric):
     """Reference: https://arxiv.org/abs/2310.02943"""
 
+    # Above this many cells the alignment switches from the dense matrix to `BandedMatrix`, or recomputes blocks of rows
+    # from checkpoints when the band would not fit either. All of them backtrack to the same alignment.
+    MAX_DENSE_CELLS = 4_000_000
+
     @staticmethod
     def _get_punctuation_indices(tokens: Sequence[str], punctuation: str) -> List[int]:
         return [i for i, t in enumerate(tokens) if t in punctuation]
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _token_regex(punctuation: str) -> re.Pattern:
+        return re.compile(rf"[{punctuation}]|[^{punctuation}\s]+")
+
+    @staticmethod
+    def _intern(reference: Sequence[str], prediction: Sequence[str]) -> Tuple[NDArray, NDArray]:
+        vocabulary = dict()
+        reference_ids = np.array([vocabulary.setdefault(t, len(vocabulary)) for t in reference], dtype=np.int64)
+        prediction_ids = np.array([vocabulary.setdefault(t, len(vocabulary)) for t in prediction], dtype=np.int64)
+        return reference_ids, prediction_ids
+
+    @staticmethod
+    def _fill_dp_rows(dp: NDArray, reference_ids: NDArray, prediction_ids: NDArray, first_row: int) -> None:
+        """Computes rows `1:` of `dp` from row 0, which holds row `first_row` of the full matrix."""
+
+        # Row `i` is computed in one pass: the substitution and deletion moves only depend on row `i - 1`, and the
+        # insertion moves along the row become a running minimum of `tmp[k] - k` shifted back by `j`.
+        offsets = np.arange(dp.shape[1])
+        tmp = np.empty(dp.shape[1], dtype=dp.dtype)
+        for r in range(1, dp.shape[0]):
+            i = first_row + r
+            previous = dp[r - 1]
+            tmp[0] = i
+            np.minimum(previous[1:] + 1, previous[:-1] + (prediction_ids != reference_ids[i - 1]), out=tmp[1:])
+            tmp -= offsets
+            np.minimum.accumulate(tmp, out=dp[r])
+            dp[r] += offsets
+
     @staticmethod
     def _compute_dp_matrix(reference: Sequence[str], prediction: Sequence[str]) -> NDArray:
         m, n = len(reference), len(prediction)
         dp = np.zeros((m + 1, n + 1), dtype=int)
 
-        for i in range(m + 1):
-            dp[i, 0] = i
-        for j in range(n + 1):
-            dp[0, j] = j
+        reference_ids, prediction_ids = PunctuationErrorRate._intern(reference, prediction)
+        dp[0] = np.arange(n + 1)
+        PunctuationErrorRate._fill_dp_rows(dp, reference_ids, prediction_ids, 0)
+
+        return dp
+
+    @staticmethod
+    def _compute_banded_dp_matrix(reference: Sequence[str], prediction: Sequence[str], width: int) -> BandedMatrix:
+        m, n = len(reference), len(prediction)
+        inf = m + n + 1
+        size = 2 * width + 1
+
+        reference_ids, prediction_ids = PunctuationErrorRate._intern(reference, prediction)
+        # Position `j` holds the prediction token that column `j` of the matrix compares against
+        prediction_ids = np.concatenate(([-1], prediction_ids))
+
+        # Cell `(i, j)` is stored at `band[i, j - i + width]`. The extra column stays `inf` so that the cell above the
+        # right edge of the band can be read without bounds checks.
+        band = np.full((m + 1, size + 1), inf, dtype=np.int32)
+        offsets = np.arange(size)
+        band[0, width : min(size, n + width + 1)] = np.arange(min(width + 1, n + 1))
 
         for i in range(1, m + 1):
-            for j in range(1, n + 1):
-                cost = 0 if reference[i - 1] == prediction[j - 1] else 1
-                dp[i, j] = min(dp[i - 1, j] + 1, dp[i, j - 1] + 1, dp[i - 1, j - 1] + cost)
+            lo = max(0, width - i)
+            hi = min(size, n - i + width + 1)
+            if lo >= hi:
+                break
 
-        return dp
+            previous = band[i - 1]
+            cost = prediction_ids[i - width + lo : i - width + hi] != reference_ids[i - 1]
+            tmp = np.minimum(previous[lo + 1 : hi + 1] + 1, previous[lo:hi] + cost)
+            tmp -= offsets[lo:hi]
+            np.minimum.accumulate(tmp, out=band[i, lo:hi])
+            band[i, lo:hi] += offsets[lo:hi]
+
+        return BandedMatrix(band[:, :size], width, inf)
 
     @staticmethod
-    def _backtrack(
-        dp: NDArray,
-        reference: Sequence[str],
-        prediction: Sequence[str],
-        reference_punct_indices: Sequence[int],
-        prediction_punct_indices: Sequence[int],
-    ) -> Tuple[int, int, int, int]:
-        i, j = len(reference), len(prediction)
+    def _checkpointed_alignment(reference: Sequence[str], prediction: Sequence[str]) -> Dict[int, int]:
+        """
+        Same alignment as `_align` over the dense matrix without storing it. The forward pass keeps every `block`-th
+        row, and the backtrack recomputes the rows of one block at a time from the checkpoint above it.
+        """
 
-        reference_punct_set = set(reference_punct_indices)
-        prediction_punct_set = set(prediction_punct_indices)
+        m, n = len(reference), len(prediction)
+        # Half of `MAX_DENSE_CELLS` for the block and the rest for the checkpoints, unless the matrix is so large that
+        # `sqrt(m)` rows per block, which bounds both to `O(sqrt(m) * n)` cells, takes less
+        block = max(1, min(m, max(math.isqrt(m), PunctuationErrorRate.MAX_DENSE_CELLS // (2 * (n + 1)) - 1)))
+        reference_ids, prediction_ids = PunctuationErrorRate._intern(reference, prediction)
+
+        rows = np.empty((block + 1, n + 1), dtype=int)
+        rows[0] = np.arange(n + 1)
+        checkpoints = {0: rows[0].copy()}
+        for first_row in range(0, m, block):
+            num_rows = min(block, m - first_row) + 1
+            PunctuationErrorRate._fill_dp_rows(rows[:num_rows], reference_ids, prediction_ids, first_row)
+            rows[0] = rows[num_rows - 1]
+            if first_row + num_rows - 1 < m:
+                checkpoints[first_row + num_rows - 1] = rows[0].copy()
+
+        alignment = dict()
+        i, j = m, n
+        for first_row in reversed(range(0, m, block)):
+            if j == 0:
+                break
+            num_rows = min(block, m - first_row) + 1
+            rows[0] = checkpoints[first_row]
+            PunctuationErrorRate._fill_dp_rows(rows[:num_rows], reference_ids, prediction_ids, first_row)
+            i, j = PunctuationErrorRate._backtrack_rows(
+                RowBlock(rows[:num_rows], first_row), reference, prediction, i, j, first_row, alignment
+            )
+
+        return alignment
 
-        num_match = 0
-        num_sub = 0
+    @staticmethod
+    def _alignment(reference: Sequence[str], prediction: Sequence[str]) -> Dict[int, int]:
+        m, n = len(reference), len(prediction)
+        if (m + 1) * (n + 1) <= PunctuationErrorRate.MAX_DENSE_CELLS:
+            dp = PunctuationErrorRate._compute_dp_matrix(reference, prediction)
+            return PunctuationErrorRate._align(dp, reference, prediction)
+
+        # Every cell on (or next to) the backtracked path has a distance of at most the total edit distance, and a
+        # band of that width computes all such cells exactly, so the alignment matches the one of the dense matrix.
+        width = max(1, editdistance.eval(reference, prediction))
+        if (m + 1) * (2 * width + 2) <= PunctuationErrorRate.MAX_DENSE_CELLS:
+            dp = PunctuationErrorRate._compute_banded_dp_matrix(reference, prediction, width)
+            return PunctuationErrorRate._align(dp, reference, prediction)
+
+        # Mostly wrong predictions need a band as wide as the matrix
+        return PunctuationErrorRate._checkpointed_alignment(reference, prediction)
+
+    @staticmethod
+    def _align(
+        dp: Union[NDArray, BandedMatrix], reference: Sequence[str], prediction: Sequence[str]
+    ) -> Dict[int, int]:
+        """Maps the index of every reference token on a diagonal (match or substitution) step to its prediction token."""
 
         alignment = {}
+        PunctuationErrorRate._backtrack_rows(dp, reference, prediction, len(reference), len(prediction), 0, alignment)
+        return alignment
 
-        while i > 0 and j > 0:
+    @staticmethod
+    def _backtrack_rows(
+        dp: Union[NDArray, BandedMatrix, RowBlock],
+        reference: Sequence[str],
+        prediction: Sequence[str],
+        i: int,
+        j: int,
+        stop_row: int,
+        alignment: Dict[int, int],
+    ) -> Tuple[int, int]:
+        """Backtracks from cell `(i, j)` until row `stop_row` or column 0 and returns the cell it stopped at."""
+
+        while i > stop_row and j > 0:
             if reference[i - 1] == prediction[j - 1]:
                 alignment[i - 1] = j - 1
                 i -= 1
@@ -99,7 +312,22 @@ class PunctuationErrorRate(Metric):
             else:
                 j -= 1
 
-        for idx in reference_punct_set:
+        return i, j
+
+    @staticmethod
+    def _count_punctuation(
+        alignment: Dict[int, int],
+        reference: Sequence[str],
+        prediction: Sequence[str],
+        reference_punct_indices: Sequence[int],
+        prediction_punct_indices: Sequence[int],
+    ) -> Tuple[int, int, int, int]:
+        prediction_punct_set = set(prediction_punct_indices)
+
+        num_match = 0
+        num_sub = 0
+
+        for idx in set(reference_punct_indices):
             if idx in alignment:
                 pred_idx = alignment[idx]
                 if pred_idx in prediction_punct_set:
@@ -116,16 +344,17 @@ class PunctuationErrorRate(Metric):
     def calculate(
         self, prediction: str, reference: str, punctuation: str = SUPPORTED_PUNCTUATION_SET
     ) -> Tuple[int, int]:
-        pred_tokens = [token for token in re.findall(rf"[{punctuation}]|[^{punctuation}\s]+", prediction)]
-        ref_tokens = [token for token in re.findall(rf"[{punctuation}]|[^{punctuation}\s]+", reference)]
+        token_regex = self._token_regex(punctuation)
+        pred_tokens = token_regex.findall(prediction)
+        ref_tokens = token_regex.findall(reference)
 
         pred_punct_indices = self._get_punctuation_indices(pred_tokens, punctuation)
         ref_punct_indices = self._get_punctuation_indices(ref_tokens, punctuation)
 
-        dp = self._compute_dp_matrix(reference=ref_tokens, prediction=pred_tokens)
+        alignment = self._alignment(reference=ref_tokens, prediction=pred_tokens)
 
-        num_insert, num_delete, num_sub, num_correct = self._backtrack(
-            dp=dp,
+        num_insert, num_delete, num_sub, num_correct = self._count_punctuation(
+            alignment=alignment,
             reference=ref_tokens,
             prediction=pred_tokens,
             reference_punct_indices=ref_punct_indices,
@@ -138,6 +367,65 @@ class PunctuationErrorRate(Metric):
         return error_count, denom
 
 
+class SharedAlignment(Metric):
+    """
+    Aligns every pair once and derives WER (with its substitution, deletion and insertion counts), CER and PER from it.
+    Words and punctuation marks are aligned jointly, so when punctuation is kept the WER counts follow the alignment used
+    for PER. Without punctuation they are identical to `WordErrorRate`.
+    """
+
+    WER_SUBSTITUTIONS = "WER substitutions"
+    WER_DELETIONS = "WER deletions"
+    WER_INSERTIONS = "WER insertions"
+
+    def calculate_breakdown(
+        self, prediction: str, reference: str, punctuation: str = SUPPORTED_PUNCTUATION_SET
+    ) -> Dict[str, Tuple[int, int]]:
+        token_regex = PunctuationErrorRate._token_regex(punctuation)
+        pred_tokens = token_regex.findall(prediction)
+        ref_tokens = token_regex.findall(reference)
+
+        pred_punct_indices = PunctuationErrorRate._get_punctuation_indices(pred_tokens, punctuation)
+        ref_punct_indices = PunctuationErrorRate._get_punctuation_indices(ref_tokens, punctuation)
+
+        if pred_tokens == ref_tokens:
+            alignment = {i: i for i in range(len(ref_tokens))}
+        else:
+            alignment = PunctuationErrorRate._alignment(reference=ref_tokens, prediction=pred_tokens)
+
+        punct_insert, punct_delete, punct_sub, punct_match = PunctuationErrorRate._count_punctuation(
+            alignment=alignment,
+            reference=ref_tokens,
+            prediction=pred_tokens,
+            reference_punct_indices=ref_punct_indices,
+            prediction_punct_indices=pred_punct_indices,
+        )
+
+        ref_punct_set = set(ref_punct_indices)
+        pred_punct_set = set(pred_punct_indices)
+        word_pairs = [(i, j) for i, j in alignment.items() if i not in ref_punct_set and j not in pred_punct_set]
+
+        num_words = len(ref_tokens) - len(ref_punct_indices)
+        num_sub = sum(1 for i, j in word_pairs if ref_tokens[i] != pred_tokens[j])
+        num_delete = num_words - len(word_pairs)
+        num_insert = len(pred_tokens) - len(pred_punct_indices) - len(word_pairs)
+
+        return {
+            Metrics.WER.value: (num_sub + num_delete + num_insert, num_words),
+            self.WER_SUBSTITUTIONS: (num_sub, num_words),
+            self.WER_DELETIONS: (num_delete, num_words),
+            self.WER_INSERTIONS: (num_insert, num_words),
+            Metrics.CER.value: CharacterErrorRate().calculate(prediction=prediction, reference=reference),
+            Metrics.PER.value: (
+                punct_insert + punct_delete + punct_sub,
+                punct_insert + punct_delete + punct_sub + punct_match,
+            ),
+        }
+
+    def calculate(self, prediction: str, reference: str) -> Tuple[int, int]:
+        return self.calculate_breakdown(prediction=prediction, reference=reference)[Metrics.WER.value]
+
+
 __all__ = [
     "Metric",
     "Metrics",
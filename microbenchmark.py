@@ -0,0 +1,250 @@
+import json
+import os
+import platform
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Sequence,
+    Tuple
+)
+
+from languages import Languages
+from metric import (
+    Metric,
+    Metrics
+)
+from normalizer import (
+    SUPPORTED_PUNCTUATION_SET,
+    Normalizer
+)
+
+SENTENCES = {
+    Languages.EN: [
+        "The 3 committees met on March 21st, 2019 to discuss the centre's new programme.",
+        "Doctor Smith said it's okay, but isn't the colour of the theatre a bit grey?",
+        "We travelled 250 miles in 4 hours — that's faster than I'd expected!",
+        "In 1990, about 45% of the labour force worked in manufacturing.",
+        "Mister and Missus Jones moved to Saint Louis with their 2 kids and a dog.",
+        "So, what do you think happens when you double the budget again?",
+    ],
+    Languages.DE: [
+        "Die Straße war nach dem Regen völlig überflutet, und niemand wusste, was zu tun ist.",
+        "Können Sie mir bitte sagen, wie spät es ist?",
+        "Der Bürgermeister äußerte sich am Mittwoch zu den Plänen für das neue Rathaus.",
+        "Über 300 Menschen nahmen an der Veranstaltung (im Freien) teil.",
+        "Warum hat er das Angebot abgelehnt, obwohl es so großzügig war?",
+    ],
+    Languages.ES: [
+        "¿Dónde está la estación de tren más cercana, por favor?",
+        "El niño comió una manzana en el jardín mientras llovía.",
+        "La reunión de la comisión se celebrará el próximo miércoles a las diez.",
+        "¡Qué sorpresa verte aquí después de tantos años!",
+        "Según el informe, la economía creció un 2,5% durante el último año.",
+    ],
+    Languages.FR: [
+        "Ça, c'est l'été où nous étions à la plage avec nos amis, n'est-ce pas ?",
+        "Le garçon a mangé une pomme dans le jardin pendant qu'il pleuvait.",
+        "Où êtes-vous allés pendant les vacances de Noël ?",
+        "Les œuvres exposées au musée ont été restaurées l'année dernière.",
+        "Il faut agir maintenant, car la situation devient très préoccupante.",
+    ],
+    Languages.IT: [
+        "Perché non sei venuto alla festa di compleanno di Giulia ieri sera?",
+        "La città è famosa per la sua cucina e per i suoi musei più antichi.",
+        "Il presidente ha dichiarato che la riforma sarà approvata entro l'anno.",
+        "Dopo la pioggia, il cielo si è schiarito e abbiamo visto l'arcobaleno.",
+        "Quante persone hanno partecipato alla conferenza di martedì?",
+    ],
+    Languages.PT_PT: [
+        "A reunião da comissão vai realizar-se na próxima quarta-feira, às dez horas.",
+        "Onde é que fica a estação de comboios mais próxima?",
+        "O rapaz comeu uma maçã no jardim enquanto chovia.",
+        "As exportações aumentaram durante o último trimestre, segundo o relatório.",
+        "Porque é que não vieste ao jantar de sábado à noite?",
+    ],
+    Languages.PT_BR: [
+        "A reunião da comissão vai acontecer na próxima quarta-feira, às dez horas.",
+        "Onde fica a estação de trem mais próxima, por favor?",
+        "O menino comeu uma maçã no jardim enquanto chovia.",
+        "As exportações aumentaram no último trimestre, de acordo com o relatório.",
+        "Por que você não veio ao jantar de sábado à noite?",
+    ],
+}
+
+# Number of sentences per reference. `TED_LIUM` is about the length of a full talk.
+LENGTH_BUCKETS = {
+    "short": 1,
+    "medium": 4,
+    "long": 20,
+    "TED_LIUM": 300,
+}
+
+ERROR_RATE = 0.1
+
+
+def build_references(language: Languages, num_sentences: int, num_references: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    sentences = SENTENCES[language]
+    return [" ".join(rng.choice(sentences) for _ in range(num_sentences)) for _ in range(num_references)]
+
+
+def corrupt(sentence: str, rng: random.Random) -> str:
+    """Simulates a transcript by substituting, deleting and inserting about `ERROR_RATE` of the tokens."""
+
+    tokens = sentence.split()
+    res = list()
+    for token in tokens:
+        x = rng.random()
+        if x < ERROR_RATE / 3:
+            res.append(rng.choice(tokens))
+        elif x < 2 * ERROR_RATE / 3:
+            continue
+        elif x < ERROR_RATE:
+            res.extend([token, rng.choice(tokens)])
+        else:
+            res.append(token)
+    return " ".join(res)
+
+
+def measure(fn: Callable[[], None], num_items: int, min_sec: float, repeat: int) -> float:
+    """Returns the best throughput in items per second over `repeat` runs of at least `min_sec` each."""
+
+    best = 0.0
+    for _ in range(repeat):
+        num_calls = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            num_calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_sec:
+                break
+        best = max(best, num_calls * num_items / elapsed)
+    return best
+
+
+def run(languages: Sequence[Languages], buckets: Sequence[str], min_sec: float, repeat: int) -> Dict[str, Dict]:
+    wer = Metric.create(Metrics.WER)
+    per = Metric.create(Metrics.PER)
+
+    res = dict()
+    for language in languages:
+        normalizer = Normalizer.create(language, keep_punctuation=False)
+        punctuation_normalizer = Normalizer.create(
+            language,
+            keep_punctuation=True,
+            punctuation_set=SUPPORTED_PUNCTUATION_SET,
+        )
+        normalizer_name = type(normalizer).__name__
+
+        for bucket in buckets:
+            num_sentences = LENGTH_BUCKETS[bucket]
+            num_references = max(1, 200 // num_sentences)
+            raw = build_references(language, num_sentences, num_references, seed=num_sentences)
+
+            references = normalizer.normalize_many(raw)
+            rng = random.Random(0)
+            predictions = [corrupt(x, rng) for x in references]
+            punctuation_references = punctuation_normalizer.normalize_many(raw)
+            punctuation_predictions = [corrupt(x, rng) for x in punctuation_references]
+            num_words = sum(len(x.split()) for x in references)
+
+            def normalize() -> None:
+                for x in raw:
+                    normalizer.normalize(x)
+
+            def calculate_wer() -> None:
+                for prediction, reference in zip(predictions, references):
+                    wer.calculate(prediction=prediction, reference=reference)
+
+            def calculate_per() -> None:
+                for prediction, reference in zip(punctuation_predictions, punctuation_references):
+                    per.calculate(prediction=prediction, reference=reference)
+
+            for name, fn in [
+                (f"{normalizer_name}.normalize", normalize),
+                ("WordErrorRate.calculate", calculate_wer),
+                ("PunctuationErrorRate.calculate", calculate_per),
+            ]:
+                throughput = measure(fn, num_items=len(raw), min_sec=min_sec, repeat=repeat)
+                case = f"{name}/{language.value}/{bucket}"
+                res[case] = {
+                    "references_per_sec": throughput,
+                    "words_per_sec": throughput * num_words / len(raw),
+                }
+                print(f"{case}: {throughput:.1f} references/s ({res[case]['words_per_sec']:.0f} words/s)")
+
+    return res
+
+
+def find_regressions(
+    results: Dict[str, Dict], baseline: Dict[str, Dict], max_regression: float
+) -> List[Tuple[str, float]]:
+    regressions = list()
+    for case, x in results.items():
+        if case not in baseline:
+            continue
+        change = x["words_per_sec"] / baseline[case]["words_per_sec"] - 1
+        if change < -max_regression:
+            regressions.append((case, change))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description="Measure the throughput of the normalizers and metrics")
+    parser.add_argument(
+        "--languages", nargs="+", default=[x.value for x in Languages], choices=[x.value for x in Languages]
+    )
+    parser.add_argument("--buckets", nargs="+", default=list(LENGTH_BUCKETS), choices=list(LENGTH_BUCKETS))
+    parser.add_argument("--min-sec", type=float, default=0.2, help="Minimum duration of each timed run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Path of the JSON file the results are written to")
+    parser.add_argument("--baseline", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.1,
+        help="Fail when the throughput of a case drops by more than this fraction relative to `--baseline`",
+    )
+    args = parser.parse_args()
+
+    results = run(
+        languages=[Languages(x) for x in args.languages],
+        buckets=args.buckets,
+        min_sec=args.min_sec,
+        repeat=args.repeat,
+    )
+
+    if args.output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "processor": platform.processor(),
+                    "cases": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["cases"]
+
+        regressions = find_regressions(results, baseline, args.max_regression)
+        for case, change in regressions:
+            print(f"Regression in {case}: {100 * change:+.1f}% words/s", file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
+        print(f"No regressions beyond {100 * args.max_regression:.0f}% relative to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
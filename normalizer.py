@@ -1,6 +1,13 @@
 import re
 import string
+import threading
 import unicodedata
+from functools import lru_cache
+from typing import (
+    List,
+    Sequence,
+    Union
+)
 
 import inflect
 
@@ -17,6 +24,10 @@ class Normalizer(object):
     def normalize(self, sentence: str, raise_error_on_invalid_sentence: bool) -> str:
         raise NotImplementedError()
 
+    def normalize_many(self, sentences: Sequence[str], raise_error_on_invalid_sentence: bool = False) -> List[str]:
+        normalize = self.normalize
+        return [normalize(x, raise_error_on_invalid_sentence=raise_error_on_invalid_sentence) for x in sentences]
+
     @classmethod
     def create(
         cls,
@@ -63,42 +74,68 @@ class DefaultNormalizer(Normalizer):
         "Ł": "L",
     }
 
+    _BRACKETS_PATTERN = re.compile(r"[<\[][^>\]]*[>\]]")
+    _PARENTHESES_PATTERN = re.compile(r"\(([^)]+?)\)")
+    _WHITESPACE_PATTERN = re.compile(r"\s+")
+
+    class _CodepointTable(dict):
+        """
+        `str.translate` table that maps each NFKD codepoint the first time it is seen: additional diacritics are spelled
+        out, combining marks are dropped, other marks, symbols and unsupported punctuation become spaces, and
+        `removable_punctuation` is dropped.
+        """
+
+        def __init__(self, removable_punctuation: str) -> None:
+            super().__init__()
+            self._removable_punctuation = removable_punctuation
+
+        def __missing__(self, codepoint: int) -> Union[int, str]:
+            c = chr(codepoint)
+            category = unicodedata.category(c)
+            if c in DefaultNormalizer.ADDITIONAL_DIACRITICS:
+                res = DefaultNormalizer.ADDITIONAL_DIACRITICS[c]
+            elif category == "Mn":
+                res = ""
+            elif category[0] in "MS" or (category[0] == "P" and c not in SUPPORTED_PUNCTUATION_SET):
+                res = " "
+            elif c in self._removable_punctuation:
+                res = ""
+            else:
+                res = c
+            # Single characters are stored as codepoints, which `str.translate` handles without building strings
+            if len(res) == 1:
+                res = ord(res)
+            self[codepoint] = res
+            return res
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _codepoint_table(removable_punctuation: str) -> "DefaultNormalizer._CodepointTable":
+        return DefaultNormalizer._CodepointTable(removable_punctuation)
+
+    def __init__(self, keep_punctuation: bool, punctuation_set: str = SUPPORTED_PUNCTUATION_SET) -> None:
+        super().__init__(keep_punctuation, punctuation_set)
+
+        if keep_punctuation:
+            removable_punctuation = "".join(sorted(set(SUPPORTED_PUNCTUATION_SET) - set(punctuation_set)))
+        else:
+            removable_punctuation = SUPPORTED_PUNCTUATION_SET
+
+        self._table = self._codepoint_table(removable_punctuation)
+
     def _remove_symbols_and_diacritics(self, s: str) -> str:
-        return "".join(
-            (
-                DefaultNormalizer.ADDITIONAL_DIACRITICS[c]
-                if c in DefaultNormalizer.ADDITIONAL_DIACRITICS
-                else (
-                    ""
-                    if unicodedata.category(c) == "Mn"
-                    else (
-                        " "
-                        if unicodedata.category(c)[0] in "MS"
-                        or (unicodedata.category(c)[0] == "P" and c not in SUPPORTED_PUNCTUATION_SET)
-                        else c
-                    )
-                )
-            )
-            for c in unicodedata.normalize("NFKD", s)
-        )
+        return unicodedata.normalize("NFKD", s).translate(self._codepoint_table(""))
 
     def normalize(self, sentence: str, raise_error_on_invalid_sentence: bool = False) -> str:
         sentence = sentence.lower()
-        sentence = re.sub(r"[<\[][^>\]]*[>\]]", "", sentence)
-        sentence = re.sub(r"\(([^)]+?)\)", "", sentence)
+        sentence = self._BRACKETS_PATTERN.sub("", sentence)
+        sentence = self._PARENTHESES_PATTERN.sub("", sentence)
         sentence = sentence.replace("!", ".")
         sentence = sentence.replace("...", "")
-        sentence = self._remove_symbols_and_diacritics(sentence).lower()
+        # Unsupported punctuation is removed by the table as well, `lower` neither adds nor removes punctuation
+        sentence = unicodedata.normalize("NFKD", sentence).translate(self._table).lower()
 
-        if self._keep_punctuation:
-            removable_punctuation = "".join(set(SUPPORTED_PUNCTUATION_SET) - set(self._punctuation_set))
-        else:
-            removable_punctuation = SUPPORTED_PUNCTUATION_SET
-
-        for c in removable_punctuation:
-            sentence = sentence.replace(c, "")
-
-        sentence = re.sub(r"\s+", " ", sentence)
+        sentence = self._WHITESPACE_PATTERN.sub(" ", sentence)
 
         return sentence
 
@@ -197,7 +234,52 @@ class EnglishNormalizer(Normalizer):
         "saint": "st",
     }
 
+    # `ABBREVIATIONS` map to words that `AMERICAN_SPELLINGS` leaves alone, so one lookup applies both
+    SPELLINGS = {**AMERICAN_SPELLINGS, **ABBREVIATIONS}
+
     APOSTROPHE_REGEX = r"(?<!\w)\'|\'(?!\w)"  # Apostrophes that are not part of a contraction
+    _APOSTROPHE_PATTERN = re.compile(APOSTROPHE_REGEX)
+
+    # Applied before `...` is removed: dashes and slashes become spaces, quotes and brackets are dropped, `!` becomes `.`
+    _SEPARATORS_TABLE = str.maketrans({**{c: " " for c in "-/–—"}, **{c: None for c in '‘":;“”`()[]'}, "!": "."})
+
+    def __init__(self, keep_punctuation: bool, punctuation_set: str = SUPPORTED_PUNCTUATION_SET) -> None:
+        super().__init__(keep_punctuation, punctuation_set)
+
+        if keep_punctuation:
+            removable_punctuation = "".join(set(SUPPORTED_PUNCTUATION_SET) - set(punctuation_set))
+        else:
+            removable_punctuation = SUPPORTED_PUNCTUATION_SET
+
+        # Applied after `...` is removed
+        self._punctuation_table = str.maketrans({**{c: None for c in removable_punctuation}, "’": "'", "&": "and"})
+
+        valid_characters = " '" + punctuation_set if keep_punctuation else " '"
+        self._valid_characters = frozenset(valid_characters + string.ascii_lowercase)
+
+    # `inflect.engine` keeps state between calls (e.g. `mill_count`), so threads must not share one
+    _inflect_engines = threading.local()
+
+    @staticmethod
+    def _inflect_engine() -> inflect.engine:
+        engines = EnglishNormalizer._inflect_engines
+        if not hasattr(engines, "engine"):
+            engines.engine = inflect.engine()
+        return engines.engine
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def _number_to_words(token: str) -> str:
+        if not any(x.isdigit() for x in token):
+            return token
+        return EnglishNormalizer._inflect_engine().number_to_words(token).replace("-", " ").replace(",", "")
+
+    @staticmethod
+    def normalize_spellings(sentence: str) -> str:
+        """Same as `to_american(normalize_abbreviations(sentence))` in a single pass over the tokens."""
+
+        spellings = EnglishNormalizer.SPELLINGS
+        return " ".join([spellings.get(x, x) for x in sentence.split()])
 
     @staticmethod
     def to_american(sentence: str) -> str:
@@ -218,39 +300,17 @@ class EnglishNormalizer(Normalizer):
         )
 
     def normalize(self, sentence: str, raise_error_on_invalid_sentence: bool = False) -> str:
-        p = inflect.engine()
-
-        sentence = sentence.lower()
-
-        for c in "-/–—":
-            sentence = sentence.replace(c, " ")
-
-        for c in '‘":;“”`()[]':
-            sentence = sentence.replace(c, "")
-
-        sentence = sentence.replace("!", ".")
+        sentence = sentence.lower().translate(self._SEPARATORS_TABLE)
         sentence = sentence.replace("...", "")
+        sentence = sentence.translate(self._punctuation_table)
 
-        if self._keep_punctuation:
-            removable_punctuation = "".join(set(SUPPORTED_PUNCTUATION_SET) - set(self._punctuation_set))
-        else:
-            removable_punctuation = SUPPORTED_PUNCTUATION_SET
-
-        for c in removable_punctuation:
-            sentence = sentence.replace(c, "")
-
-        sentence = sentence.replace("’", "'").replace("&", "and")
-
-        sentence = re.sub(self.APOSTROPHE_REGEX, "", sentence)
-
-        def num2txt(y):
-            return p.number_to_words(y).replace("-", " ").replace(",", "") if any(x.isdigit() for x in y) else y
+        sentence = self._APOSTROPHE_PATTERN.sub("", sentence)
 
-        sentence = " ".join(num2txt(x) for x in sentence.split())
+        number_to_words = self._number_to_words
+        sentence = " ".join([number_to_words(x) for x in sentence.split()])
 
         if raise_error_on_invalid_sentence:
-            valid_characters = " '" + self._punctuation_set if self._keep_punctuation else " '"
-            if not all(c in valid_characters + string.ascii_lowercase for c in sentence):
+            if not self._valid_characters.issuperset(sentence):
                 raise RuntimeError()
             if any(x.startswith("'") for x in sentence.split()):
                 raise RuntimeError()
@@ -0,0 +1,111 @@
+import os
+import queue
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+import soundfile
+from numpy.typing import NDArray
+
+import tracing
+
+_DONE = object()
+
+
+class AudioPrefetcher(object):
+    """
+    Decodes audio files in order on a background thread, staying at most `depth` files ahead of the consumer. Decoding
+    in `soundfile` releases the GIL, so it overlaps with inference on the consuming thread.
+    """
+
+    def __init__(self, paths: Sequence[str], depth: int) -> None:
+        self._paths = paths
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        for path in self._paths:
+            try:
+                tracing.count("bytes read", os.path.getsize(path))
+                start_sec = time.perf_counter()
+                with tracing.span("prefetch decode"):
+                    audio, sample_rate = soundfile.read(path, dtype="int16")
+                item = (path, audio, sample_rate, time.perf_counter() - start_sec)
+            except Exception as e:
+                item = (path, e)
+
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if self._stop.is_set():
+                return
+
+    def get(self, path: str) -> Tuple[NDArray, int, float]:
+        """Returns the samples, sample rate and decode time of the next file, which must be `path`."""
+
+        item = self._queue.get()
+        if item[0] != path:
+            raise ValueError(f"Expected `{path}` but the next prefetched file is `{item[0]}`")
+        if isinstance(item[1], Exception):
+            raise item[1]
+        return item[1], item[2], item[3]
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class Stage(object):
+    """Calls `fn` on every item put into a bounded queue from a background thread, in order."""
+
+    def __init__(self, fn: Callable[[Any], None], depth: int) -> None:
+        self._fn = fn
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._fn(item)
+            except BaseException as e:
+                self._error = e
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def put(self, item: Any) -> None:
+        self._raise_error()
+        self._queue.put(item)
+
+    def close(self, raise_error: bool = True) -> None:
+        """Waits for the queued items to be processed and re-raises the first error of `fn` if `raise_error` is set."""
+
+        self._queue.put(_DONE)
+        self._thread.join()
+        if raise_error:
+            self._raise_error()
+
+
+__all__ = [
+    "AudioPrefetcher",
+    "Stage",
+]
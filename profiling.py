@@ -0,0 +1,342 @@
+import cProfile
+import json
+import os
+import pstats
+import shutil
+import sys
+import threading
+import uuid
+from collections import (
+    Counter,
+    defaultdict
+)
+from enum import Enum
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple
+)
+
+REPO_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+BUILTINS_MODULE = "builtins"
+STDLIB_MODULE = "stdlib"
+
+SAMPLING_INTERVAL_SEC = 0.005
+
+NUM_TOP_FUNCTIONS = 30
+
+SAMPLER_THREAD_NAME = "profiling-sampler"
+
+# Innermost frame of a thread blocked in `queue.Queue.get`, `threading.Event.wait` and the like
+_CONDITION_WAIT_CODE = threading.Condition.wait.__code__
+
+
+class Profilers(Enum):
+    CPROFILE = "CPROFILE"
+    SAMPLING = "SAMPLING"
+
+
+def module_of(filename: str) -> str:
+    """
+    Groups a source file into a benchmark module (`engine`, `normalizer`, ...), the top-level package of a third-party
+    library (`whisper`, `torch`, `pvleopard`, ...) or the standard library.
+    """
+
+    if filename == "~" or filename.startswith("<"):
+        return BUILTINS_MODULE
+
+    path = os.path.abspath(filename)
+    if os.path.dirname(path) == REPO_FOLDER:
+        return os.path.splitext(os.path.basename(path))[0]
+
+    parts = path.split(os.sep)
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            i = parts.index(marker)
+            if i + 1 < len(parts):
+                return os.path.splitext(parts[i + 1])[0].split("-")[0]
+
+    return STDLIB_MODULE
+
+
+# Threads of this process that run `run_profiled` and are profiled on their own
+_profiled_threads = set()
+# Callbacks of the profiles running in this process. A thread started while one runs calls the latest in its first
+# profiling event, so that the threads a worker starts (such as the stages of `--prefetch`) are profiled as well.
+_thread_callbacks: List[Callable[[], None]] = list()
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _start_thread(frame: Any, event: str, arg: Any) -> None:
+    sys.setprofile(None)
+    if threading.current_thread().name == SAMPLER_THREAD_NAME:
+        return
+    with _lock:
+        callback = _thread_callbacks[-1] if len(_thread_callbacks) > 0 else None
+    if callback is not None:
+        callback()
+
+
+def _add_thread_callback(callback: Callable[[], None]) -> None:
+    # A worker thread started while another profile runs stops being profiled as part of it
+    thread_profile = getattr(_local, "profile", None)
+    if thread_profile is not None:
+        thread_profile.disable()
+        _local.profile = None
+
+    with _lock:
+        _profiled_threads.add(threading.get_ident())
+        _thread_callbacks.append(callback)
+        threading.setprofile(_start_thread)
+
+
+def _remove_thread_callback(callback: Callable[[], None]) -> None:
+    with _lock:
+        _profiled_threads.discard(threading.get_ident())
+        _thread_callbacks.remove(callback)
+        if len(_thread_callbacks) == 0:
+            threading.setprofile(None)
+
+
+class Sampler(object):
+    """
+    Records the Python stacks of one thread, and of the threads added while it runs, at a fixed interval from a
+    background thread. Samples of added threads waiting on a condition (e.g. an idle pipeline stage) are skipped.
+    """
+
+    def __init__(self, interval_sec: float = SAMPLING_INTERVAL_SEC) -> None:
+        self._interval_sec = interval_sec
+        self._thread_id = threading.get_ident()
+        self._thread_ids = {self._thread_id}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=SAMPLER_THREAD_NAME, daemon=True)
+        self._stacks: Counter = Counter()
+        self._labels: Dict[Any, str] = dict()
+
+    def add_thread(self) -> None:
+        """Samples the calling thread as well."""
+
+        self._thread_ids.add(threading.get_ident())
+
+    def _label(self, code: Any) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{module_of(code.co_filename)}:{code.co_name}"
+            self._labels[code] = label
+        return label
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval_sec):
+            frames = sys._current_frames()
+            for thread_id in list(self._thread_ids):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                if thread_id != self._thread_id:
+                    # Profiled on its own, e.g. a worker thread of another profile
+                    if thread_id in _profiled_threads:
+                        continue
+                    if frame.f_code is _CONDITION_WAIT_CODE:
+                        continue
+
+                stack = list()
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"interval_sec": self._interval_sec, "stacks": dict(self._stacks)}, f)
+
+
+class ThreadProfiles(object):
+    """cProfile profiles of the threads started while a worker is profiled, one per thread."""
+
+    def __init__(self) -> None:
+        self._profiles: List[cProfile.Profile] = list()
+
+    def add_thread(self) -> None:
+        """Profiles the calling thread from now on."""
+
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        _local.profile = profile
+        profile.enable()
+
+    def dump(self, path: str) -> None:
+        """Call once the threads have finished."""
+
+        for i, profile in enumerate(self._profiles):
+            profile.dump_stats(f"{path}.{i}.prof")
+
+
+def run_profiled(profiler: Profilers, folder: str, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Calls `fn` under the given profiler and writes the profile to its own file inside `folder`. Threads started while
+    `fn` runs are profiled too.
+    """
+
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, uuid.uuid4().hex)
+
+    if profiler is Profilers.CPROFILE:
+        profile = cProfile.Profile()
+        threads = ThreadProfiles()
+        _add_thread_callback(threads.add_thread)
+        profile.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            _remove_thread_callback(threads.add_thread)
+            profile.dump_stats(f"{path}.prof")
+            threads.dump(path)
+    elif profiler is Profilers.SAMPLING:
+        sampler = Sampler()
+        sampler.start()
+        _add_thread_callback(sampler.add_thread)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _remove_thread_callback(sampler.add_thread)
+            sampler.stop()
+            sampler.dump(f"{path}.json")
+    else:
+        raise ValueError(f"Cannot profile with `{profiler}`")
+
+
+def clear_profiles(folder: str) -> None:
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+
+
+def _profile_files(folder: str, extension: str) -> List[str]:
+    if not os.path.exists(folder):
+        return list()
+    return [os.path.join(folder, x) for x in sorted(os.listdir(folder)) if x.endswith(extension)]
+
+
+def merge_cprofile(folder: str) -> Optional[pstats.Stats]:
+    paths = _profile_files(folder, ".prof")
+    if len(paths) == 0:
+        return None
+    return pstats.Stats(*paths)
+
+
+def cprofile_modules(stats: pstats.Stats) -> Dict[str, float]:
+    """
+    Self time per module. Built-in functions (including C extensions such as `editdistance`) are charged to the modules
+    that called them, in proportion to the time spent under each caller.
+    """
+
+    res: Dict[str, float] = defaultdict(float)
+    for (filename, _, _), (_, _, tottime, _, callers) in stats.stats.items():
+        module = module_of(filename)
+        if module != BUILTINS_MODULE or len(callers) == 0:
+            res[module] += tottime
+            continue
+
+        caller_tottime = {caller: x[2] for caller, x in callers.items()}
+        total = sum(caller_tottime.values())
+        for caller, x in caller_tottime.items():
+            share = x / total if total > 0 else 1 / len(caller_tottime)
+            res[module_of(caller[0])] += tottime * share
+
+    return dict(res)
+
+
+def merge_samples(folder: str) -> Tuple[Counter, float]:
+    stacks: Counter = Counter()
+    interval_sec = SAMPLING_INTERVAL_SEC
+    for path in _profile_files(folder, ".json"):
+        with open(path) as f:
+            x = json.load(f)
+        interval_sec = x["interval_sec"]
+        stacks.update(x["stacks"])
+    return stacks, interval_sec
+
+
+def sampled_modules(stacks: Counter, interval_sec: float) -> Dict[str, float]:
+    """Estimated self time per module, taken from the innermost Python frame of every sample."""
+
+    res: Dict[str, float] = defaultdict(float)
+    for stack, count in stacks.items():
+        leaf = stack.rsplit(";", 1)[-1]
+        res[leaf.split(":", 1)[0]] += count * interval_sec
+    return dict(res)
+
+
+def format_modules(modules: Dict[str, float]) -> List[str]:
+    total = sum(modules.values())
+    lines = [f"{'Module':<24} {'Self sec':>12} {'Share':>8}"]
+    for module, sec in sorted(modules.items(), key=lambda x: -x[1]):
+        share = 100 * sec / total if total > 0 else 0.0
+        lines.append(f"{module:<24} {sec:>12.3f} {share:>7.1f}%")
+    return lines
+
+
+def write_report(
+    profiler: Profilers,
+    folder: str,
+    report_path: str,
+    collapsed_path: Optional[str] = None,
+) -> Optional[Dict[str, float]]:
+    """
+    Merges the worker profiles in `folder` into a text report with the time per module and the most expensive
+    functions. With `SAMPLING`, `collapsed_path` receives the stacks in the collapsed format of `flamegraph.pl`.
+    """
+
+    if profiler is Profilers.CPROFILE:
+        stats = merge_cprofile(folder)
+        if stats is None:
+            return None
+        modules = cprofile_modules(stats)
+        with open(report_path, "w") as f:
+            f.write("\n".join(format_modules(modules)) + "\n\n")
+            stats.stream = f
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(NUM_TOP_FUNCTIONS)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(NUM_TOP_FUNCTIONS)
+    elif profiler is Profilers.SAMPLING:
+        stacks, interval_sec = merge_samples(folder)
+        if len(stacks) == 0:
+            return None
+        modules = sampled_modules(stacks, interval_sec)
+        leaves: Counter = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        with open(report_path, "w") as f:
+            f.write("\n".join(format_modules(modules)) + "\n\n")
+            f.write(f"{'Function':<64} {'Samples':>10}\n")
+            for function, count in leaves.most_common(NUM_TOP_FUNCTIONS):
+                f.write(f"{function:<64} {count:>10}\n")
+        if collapsed_path is not None:
+            with open(collapsed_path, "w") as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+    else:
+        raise ValueError(f"Cannot report profiles of `{profiler}`")
+
+    return modules
+
+
+__all__ = [
+    "Profilers",
+    "clear_profiles",
+    "format_modules",
+    "module_of",
+    "run_profiled",
+    "write_report",
+]
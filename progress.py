@@ -0,0 +1,164 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional
+)
+
+from journal import UtteranceResult
+
+
+class ProgressMonitor(object):
+    """
+    Reports the progress of a run from the parent process by following the journal files the workers append to. Every
+    worker writes its own file, so the results per file give the per-worker rate, measured from when the file appeared.
+    A recycled worker starts a new file, and files without recent results are left out of the rates. Files that exist
+    when the monitor starts belong to an earlier run that is being resumed.
+    """
+
+    def __init__(
+        self,
+        journal_folder: str,
+        num_total: int,
+        metric_name: Optional[str] = None,
+        interval_sec: float = 10.0,
+        json_path: Optional[str] = None,
+    ) -> None:
+        self._folder = journal_folder
+        self._num_total = num_total
+        self._metric_name = metric_name
+        self._interval_sec = interval_sec
+        self._json_path = json_path
+
+        self._offsets: Dict[str, int] = dict()
+        self._resumed_files = set(x for x in self._journal_files())
+        self._num_resumed = 0
+        self._worker_counts: Dict[str, int] = defaultdict(int)
+        # When each file appeared, at the latest, and when it last had new results
+        self._worker_first_sec: Dict[str, float] = dict()
+        self._worker_last_sec: Dict[str, float] = dict()
+        self._audio_sec = 0.0
+        self._num_errors = 0
+        self._num_tokens = 0
+
+        self._start_sec = time.time()
+        self._last_poll_sec = self._start_sec
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _journal_files(self) -> List[str]:
+        if not os.path.exists(self._folder):
+            return list()
+        return [x for x in sorted(os.listdir(self._folder)) if x.endswith(".jsonl")]
+
+    def _add(self, name: str, result: UtteranceResult) -> None:
+        if name in self._resumed_files:
+            self._num_resumed += 1
+        else:
+            self._worker_counts[name] += 1
+            self._worker_last_sec[name] = time.time()
+            # Engines that do not report the audio they processed (e.g. cloud engines) journal `audio_sec` as -1
+            if result.duration_sec is not None:
+                self._audio_sec += result.duration_sec
+            else:
+                self._audio_sec += max(result.audio_sec, 0.0)
+
+        if self._metric_name is None and len(result.num_errors) > 0:
+            self._metric_name = "WER" if "WER" in result.num_errors else next(iter(result.num_errors))
+        if self._metric_name in result.num_errors:
+            self._num_errors += result.num_errors[self._metric_name]
+            self._num_tokens += result.num_tokens[self._metric_name]
+
+    def poll(self) -> None:
+        poll_sec = time.time()
+        for name in self._journal_files():
+            # The file was not there at the previous poll
+            self._worker_first_sec.setdefault(name, self._last_poll_sec)
+            with open(os.path.join(self._folder, name), "rb") as f:
+                f.seek(self._offsets.get(name, 0))
+                data = f.read()
+            # A worker may be in the middle of writing the last line
+            end = data.rfind(b"\n") + 1
+            self._offsets[name] = self._offsets.get(name, 0) + end
+            for line in data[:end].splitlines():
+                try:
+                    self._add(name, UtteranceResult(**json.loads(line)))
+                except (ValueError, TypeError):
+                    continue
+        self._last_poll_sec = poll_sec
+
+    def _worker_rates(self) -> List[float]:
+        now_sec = time.time()
+        res = list()
+        for name, count in self._worker_counts.items():
+            active_sec = self._worker_last_sec[name] - self._worker_first_sec[name]
+            # A worker that stopped writing has finished or was replaced by a recycled one
+            if now_sec - self._worker_last_sec[name] > 2 * max(self._interval_sec, active_sec / count):
+                continue
+            res.append(count / max(now_sec - self._worker_first_sec[name], 1e-9))
+        return res
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed_sec = time.time() - self._start_sec
+        num_new = sum(self._worker_counts.values())
+        num_completed = self._num_resumed + num_new
+        rate = num_new / elapsed_sec if elapsed_sec > 0 else 0.0
+
+        return {
+            "time": time.time(),
+            "elapsed_sec": elapsed_sec,
+            "completed": num_completed,
+            "total": self._num_total,
+            "audio_hours_per_hour": self._audio_sec / elapsed_sec if elapsed_sec > 0 else 0.0,
+            "metric": self._metric_name,
+            "error_rate": 100 * self._num_errors / self._num_tokens if self._num_tokens > 0 else None,
+            "worker_rates": self._worker_rates(),
+            "eta_sec": (self._num_total - num_completed) / rate if rate > 0 else None,
+        }
+
+    @staticmethod
+    def format(stats: Dict[str, Any]) -> str:
+        parts = [
+            f"{stats['completed']}/{stats['total']} ({100 * stats['completed'] / max(stats['total'], 1):.1f}%)",
+            f"{stats['audio_hours_per_hour']:.2f} audio-h/h",
+        ]
+        if stats["error_rate"] is not None:
+            parts.append(f"{stats['metric']} {stats['error_rate']:.2f}")
+        if len(stats["worker_rates"]) > 0:
+            rates = stats["worker_rates"]
+            parts.append(f"{len(rates)} workers {min(rates):.2f}-{max(rates):.2f} utt/s")
+        if stats["eta_sec"] is not None:
+            eta_sec = int(stats["eta_sec"])
+            parts.append(f"ETA {eta_sec // 3600}:{eta_sec // 60 % 60:02d}:{eta_sec % 60:02d}")
+        return "Progress: " + ", ".join(parts)
+
+    def report(self) -> None:
+        self.poll()
+        stats = self.stats()
+        print(self.format(stats), file=sys.stderr, flush=True)
+        if self._json_path is not None:
+            with open(self._json_path, "a") as f:
+                f.write(json.dumps(stats) + "\n")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval_sec):
+            self.report()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.report()
+
+
+__all__ = [
+    "ProgressMonitor",
+]
@@ -0,0 +1,146 @@
+import os
+from argparse import ArgumentParser
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+from cache import (
+    DEFAULT_CACHE_FOLDER,
+    ManifestGroup,
+    ReplayRow,
+    TranscriptCache
+)
+from dataset import (
+    Dataset,
+    Datasets
+)
+from languages import Languages
+from metric import Metrics
+from scoring import (
+    RESULTS_FOLDER,
+    VariantScorer,
+    scoring_variants,
+    union_punctuation_set,
+    update_results_log
+)
+
+ReplayResult = namedtuple("ReplayResult", ["metric", "num_errors", "num_tokens"])
+
+
+def rescore(
+    language: Languages,
+    punctuation: bool,
+    punctuation_sets: Sequence[str],
+    pairs: Sequence[Tuple[str, str]],
+    metric_names: Optional[Sequence[Metrics]],
+) -> Sequence[ReplayResult]:
+    scorer = VariantScorer(language, scoring_variants(punctuation, punctuation_sets), metric_names)
+
+    return [ReplayResult(k, num_errors, num_tokens) for k, (num_errors, num_tokens) in scorer.score_many(pairs).items()]
+
+
+def with_current_references(
+    group_rows: Mapping[ManifestGroup, Sequence[ReplayRow]],
+) -> Dict[ManifestGroup, List[ReplayRow]]:
+    """
+    Swaps the references that runs recorded for the references of their datasets as the current normalizer normalizes
+    them. Utterances that the dataset no longer yields (e.g. the normalizer now rejects the sentence) are dropped.
+    """
+
+    references = dict()
+    res = dict()
+    for group, rows in group_rows.items():
+        punctuation_set = union_punctuation_set(group.punctuation_set.split())
+        key = (group.dataset, group.dataset_folder, group.language, group.punctuation, punctuation_set)
+        if key not in references:
+            dataset = Dataset.create(
+                Datasets(group.dataset),
+                folder=group.dataset_folder,
+                language=Languages(group.language),
+                punctuation=group.punctuation,
+                punctuation_set=punctuation_set,
+            )
+            references[key] = dict(dataset.get(i) for i in range(dataset.size()))
+
+        current = references[key]
+        res[group] = [row._replace(reference=current[row.audio_path]) for row in rows if row.audio_path in current]
+        if len(res[group]) < len(rows):
+            print(f"{group.engine} {group.dataset} {group.language}: {len(rows) - len(res[group])} utterances dropped")
+
+    return res
+
+
+def main():
+    parser = ArgumentParser(description="Recompute metrics from cached transcripts without running any engine")
+    parser.add_argument("--cache-folder", default=DEFAULT_CACHE_FOLDER)
+    parser.add_argument("--engines", nargs="+", default=None)
+    parser.add_argument("--datasets", nargs="+", default=None)
+    parser.add_argument("--languages", nargs="+", default=None, choices=[x.value for x in Languages])
+    parser.add_argument("--metrics", nargs="+", default=None, choices=[x.value for x in Metrics])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    cache = TranscriptCache(args.cache_folder)
+
+    groups = cache.manifest_groups()
+    if args.engines is not None:
+        groups = [g for g in groups if g.engine in args.engines]
+    if args.datasets is not None:
+        groups = [g for g in groups if g.dataset in args.datasets]
+    if args.languages is not None:
+        groups = [g for g in groups if g.language in args.languages]
+
+    group_rows = {group: cache.replay_rows(group) for group in groups}
+    group_rows = {group: rows for group, rows in group_rows.items() if len(rows) > 0}
+    cache.close()
+    group_rows = with_current_references(group_rows)
+
+    print(f"Replaying {sum(len(x) for x in group_rows.values())} transcripts from {len(group_rows)} runs...")
+    futures = {}
+    with ProcessPoolExecutor(args.num_workers) as executor:
+        for group, rows in group_rows.items():
+            metrics = None if args.metrics is None else [Metrics(x) for x in args.metrics]
+            pairs = [(row.transcript, row.reference) for row in rows]
+            futures[group] = [
+                executor.submit(
+                    rescore,
+                    language=Languages(group.language),
+                    punctuation=group.punctuation,
+                    # Runs that scored several punctuation sets record them separated by spaces
+                    punctuation_sets=group.punctuation_set.split(),
+                    pairs=pairs[i : i + args.chunk_size],
+                    metric_names=metrics,
+                )
+                for i in range(0, len(pairs), args.chunk_size)
+            ]
+
+    for group, group_futures in futures.items():
+        results = [result for future in group_futures for result in future.result()]
+        values = dict()
+        for metric_name in dict.fromkeys(x.metric for x in results):
+            num_errors = sum(x.num_errors for x in results if x.metric == metric_name)
+            num_tokens = sum(x.num_tokens for x in results if x.metric == metric_name)
+            if num_tokens == 0:
+                continue
+            values[metric_name] = 100 * float(num_errors) / num_tokens
+
+        rows = group_rows[group]
+        if all(row.process_sec is not None for row in rows):
+            values["RTF"] = sum(row.process_sec for row in rows) / sum(row.audio_sec for row in rows)
+
+        update_results_log(os.path.join(RESULTS_FOLDER, group.results_log), values)
+
+        summary = ", ".join(f"{k}: {v:.2f}" for k, v in values.items())
+        print(f"{group.engine} {group.dataset} {group.language} ({len(rows)} utterances) -> {summary}")
+
+
+if __name__ == "__main__":
+    main()
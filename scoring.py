@@ -0,0 +1,236 @@
+import os
+from collections import namedtuple
+from typing import (
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+import tracing
+from languages import Languages
+from metric import (
+    Metric,
+    Metrics
+)
+from normalizer import (
+    SUPPORTED_PUNCTUATION_SET,
+    EnglishNormalizer,
+    Normalizer
+)
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), "results")
+
+ScoringVariant = namedtuple("ScoringVariant", ["punctuation", "punctuation_set", "suffix"])
+
+
+def normalize_pair(
+    normalizer: Normalizer,
+    language: Languages,
+    transcript: str,
+    reference: str,
+) -> Tuple[str, str]:
+    norm_transcript = normalizer.normalize(transcript)
+
+    ref_sentence = reference.strip("\n ").lower()
+    transcribed_sentence = norm_transcript.strip("\n ").lower()
+
+    if language == Languages.EN:
+        ref_sentence = EnglishNormalizer.normalize_spellings(ref_sentence)
+        transcribed_sentence = EnglishNormalizer.normalize_spellings(transcribed_sentence)
+
+    return transcribed_sentence, ref_sentence
+
+
+def score_normalized(
+    metrics: Mapping[Metrics, Metric],
+    prediction: str,
+    reference: str,
+) -> Dict[str, Tuple[int, int]]:
+    """Returns `(num_errors, num_tokens)` per reported metric. `Metrics.ALL` reports every metric of its alignment."""
+
+    res = dict()
+    for metric_name, metric in metrics.items():
+        if metric_name is Metrics.ALL:
+            res.update(metric.calculate_breakdown(prediction=prediction, reference=reference))
+        else:
+            res[metric_name.value] = metric.calculate(prediction=prediction, reference=reference)
+    return res
+
+
+def score(
+    normalizer: Normalizer,
+    language: Languages,
+    metrics: Mapping[Metrics, Metric],
+    transcript: str,
+    reference: str,
+) -> Dict[str, Tuple[int, int]]:
+    transcribed_sentence, ref_sentence = normalize_pair(normalizer, language, transcript, reference)
+
+    return score_normalized(metrics, prediction=transcribed_sentence, reference=ref_sentence)
+
+
+def default_metrics(punctuation: bool) -> Sequence[Metrics]:
+    return [Metrics.PER] if punctuation else [Metrics.WER]
+
+
+def union_punctuation_set(punctuation_sets: Sequence[str]) -> str:
+    return "".join(c for c in SUPPORTED_PUNCTUATION_SET if any(c in x for x in punctuation_sets))
+
+
+def reference_normalizer(language: Languages, punctuation: bool, punctuation_sets: Sequence[str]) -> Normalizer:
+    """The normalizer `Dataset.create` applies to the references of a run, and that transcripts are scored with."""
+
+    return Normalizer.create(
+        language=language,
+        keep_punctuation=punctuation,
+        punctuation_set=union_punctuation_set(punctuation_sets),
+    )
+
+
+def scoring_variants(punctuation: bool, punctuation_sets: Sequence[str]) -> List[ScoringVariant]:
+    """
+    A single punctuation set is scored as before. Several sets are scored together with WER, and the metrics of each set
+    are labelled with it (e.g. `PER [,.?]`).
+    """
+
+    if not punctuation or len(punctuation_sets) == 1:
+        return [ScoringVariant(punctuation, punctuation_sets[0], "")]
+
+    return [ScoringVariant(False, union_punctuation_set(punctuation_sets), "")] + [
+        ScoringVariant(True, x, f" [{x}]") for x in punctuation_sets
+    ]
+
+
+def restrict_punctuation(sentence: str, variant: ScoringVariant) -> str:
+    """Drops the punctuation marks of a normalized sentence that the variant does not score."""
+
+    removable = [c for c in SUPPORTED_PUNCTUATION_SET if not variant.punctuation or c not in variant.punctuation_set]
+    if not any(c in sentence for c in removable):
+        return sentence
+
+    return " ".join(sentence.translate({ord(c): None for c in removable}).split())
+
+
+class VariantScorer(object):
+    """
+    Scores one transcript against every variant. Transcripts are normalized the same way as the references of the
+    dataset, for the union of the punctuation sets, and each variant then restricts both to its own set. Normalizing
+    them differently would spell out numbers differently, e.g. `3.5` keeping `.` versus dropping it.
+    """
+
+    def __init__(
+        self,
+        language: Languages,
+        variants: Sequence[ScoringVariant],
+        metric_names: Optional[Sequence[Metrics]] = None,
+    ) -> None:
+        self._language = language
+        self._normalizer = reference_normalizer(
+            language,
+            punctuation=any(x.punctuation for x in variants),
+            punctuation_sets=[x.punctuation_set for x in variants],
+        )
+        self._variants = list()
+        for variant in variants:
+            names = default_metrics(variant.punctuation) if metric_names is None else metric_names
+            self._variants.append((variant, {m: Metric.create(m) for m in names}))
+
+    def score(self, transcript: str, reference: str) -> Dict[str, Tuple[int, int]]:
+        return self.score_utterance(transcript=transcript, reference=reference)[0]
+
+    def score_utterance(self, transcript: str, reference: str) -> Tuple[Dict[str, Tuple[int, int]], int, int]:
+        """Also returns the number of reference and transcript words after normalizing for the first variant."""
+
+        with tracing.span("normalize"):
+            transcript, reference = normalize_pair(self._normalizer, self._language, transcript, reference)
+
+        res = dict()
+        num_words = None
+        for variant, metrics in self._variants:
+            transcribed_sentence = restrict_punctuation(transcript, variant)
+            ref_sentence = restrict_punctuation(reference, variant)
+            if num_words is None:
+                num_words = len(ref_sentence.split()), len(transcribed_sentence.split())
+
+            with tracing.span("metric"):
+                scores = score_normalized(metrics, prediction=transcribed_sentence, reference=ref_sentence)
+            res.update((f"{k}{variant.suffix}", v) for k, v in scores.items())
+
+        return res, num_words[0], num_words[1]
+
+    def score_many(self, pairs: Sequence[Tuple[str, str]]) -> Dict[str, Tuple[int, int]]:
+        """Returns the `(num_errors, num_tokens)` totals of a batch of `(transcript, reference)` pairs."""
+
+        # Later metrics overwrite the entries of earlier ones, the same way `score_normalized` does
+        normalized = [normalize_pair(self._normalizer, self._language, x, y) for x, y in pairs]
+
+        res = dict()
+        for variant, metrics in self._variants:
+            predictions = [restrict_punctuation(x[0], variant) for x in normalized]
+            references = [restrict_punctuation(x[1], variant) for x in normalized]
+
+            for metric_name, metric in metrics.items():
+                if metric_name is Metrics.ALL:
+                    breakdown = dict()
+                    for prediction, reference in zip(predictions, references):
+                        for key, (num_errors, num_tokens) in metric.calculate_breakdown(prediction, reference).items():
+                            total = breakdown.setdefault(key, (0, 0))
+                            breakdown[key] = (total[0] + num_errors, total[1] + num_tokens)
+                    res.update((f"{k}{variant.suffix}", v) for k, v in breakdown.items())
+                else:
+                    res[f"{metric_name.value}{variant.suffix}"] = metric.calculate_many(predictions, references)[1]
+
+        return res
+
+
+def read_results_log(path: str) -> Dict[str, float]:
+    res = dict()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                try:
+                    res[key.strip()] = float(value)
+                except ValueError:
+                    continue
+    return res
+
+
+def update_results_log(path: str, values: Mapping[str, float]) -> None:
+    """Overwrites the given entries of a results log and leaves any other entries as they are."""
+
+    lines = list()
+    if os.path.exists(path):
+        with open(path) as f:
+            lines = [line.rstrip("\n") for line in f]
+
+    pending = dict(values)
+    for i, line in enumerate(lines):
+        key = line.partition(":")[0].strip()
+        if key in pending:
+            lines[i] = f"{key}: {str(pending.pop(key))}"
+    lines.extend(f"{key}: {str(value)}" for key, value in pending.items())
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.writelines(f"{line}\n" for line in lines)
+
+
+__all__ = [
+    "RESULTS_FOLDER",
+    "ScoringVariant",
+    "VariantScorer",
+    "default_metrics",
+    "normalize_pair",
+    "reference_normalizer",
+    "read_results_log",
+    "restrict_punctuation",
+    "score",
+    "score_normalized",
+    "scoring_variants",
+    "union_punctuation_set",
+    "update_results_log",
+]
@@ -0,0 +1,269 @@
+import queue
+import time
+from collections import (
+    deque,
+    namedtuple
+)
+from multiprocessing import (
+    resource_tracker,
+    shared_memory
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+import numpy as np
+import soundfile
+from numpy.typing import NDArray
+
+import tracing
+
+# Where a decoded utterance lives in the ring buffer of the decoder process `decoder`
+AudioDescriptor = namedtuple(
+    "AudioDescriptor",
+    ["path", "decoder", "segment", "slot", "offset", "shape", "sample_rate", "decode_sec"],
+)
+
+# Sent instead of a descriptor when decoding a file failed, or with `path=None` when the run is being stopped
+DecoderError = namedtuple("DecoderError", ["path", "message"])
+
+SAMPLE_BYTES = np.dtype(np.int16).itemsize
+
+
+class AudioRing(object):
+    """
+    Allocates contiguous regions of a shared memory segment in FIFO order. Regions may be released in any order, but
+    their space is reused only once every region allocated before them has been released as well.
+    """
+
+    def __init__(self, size_bytes: int) -> None:
+        self._shm = shared_memory.SharedMemory(create=True, size=size_bytes)
+        self._size = size_bytes
+        self._head = 0
+        self._next_slot = 0
+        self._allocations = deque()
+        self._released = set()
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def is_empty(self) -> bool:
+        return len(self._allocations) == 0
+
+    def allocate(self, num_bytes: int) -> Optional[Tuple[int, int]]:
+        """Returns the slot and offset of a new region, or `None` when there is not enough contiguous free space."""
+
+        num_bytes = max(num_bytes, SAMPLE_BYTES)
+        if self.is_empty():
+            offset = 0
+        else:
+            tail = self._allocations[0][1]
+            if self._allocations[-1][1] >= tail:
+                # Used space is `[tail, head)`
+                if self._size - self._head >= num_bytes:
+                    offset = self._head
+                elif tail >= num_bytes:
+                    offset = 0
+                else:
+                    return None
+            elif tail - self._head >= num_bytes:
+                # Used space wraps around and is `[tail, ...)` and `[0, head)`
+                offset = self._head
+            else:
+                return None
+
+        slot = self._next_slot
+        self._next_slot += 1
+        self._allocations.append((slot, offset))
+        self._head = offset + num_bytes
+        return slot, offset
+
+    def view(self, offset: int, shape: Tuple[int, ...]) -> NDArray:
+        return np.ndarray(shape, dtype=np.int16, buffer=self._shm.buf, offset=offset)
+
+    def release(self, slot: int) -> None:
+        self._released.add(slot)
+        while len(self._allocations) > 0 and self._allocations[0][0] in self._released:
+            self._released.remove(self._allocations.popleft()[0])
+
+    def close(self) -> None:
+        self._shm.close()
+        self._shm.unlink()
+
+
+def run_decoder(
+    decoder: int,
+    jobs: Sequence[Tuple[int, str]],
+    audio_queues: Sequence[Any],
+    release_queue: Any,
+    size_bytes: int,
+) -> None:
+    """
+    Decodes `(worker, path)` jobs in order straight into a shared ring buffer and sends a descriptor of each to the
+    queue of its worker. Blocks while the ring is full until workers release earlier utterances. A `None` on
+    `release_queue` stops the decoder early, for example after a worker failed.
+    """
+
+    ring = AudioRing(size_bytes)
+
+    def release(block: bool) -> bool:
+        """Applies released slots, waiting for one if `block`. Returns `False` once told to stop."""
+
+        while True:
+            try:
+                slot = release_queue.get(block=block)
+            except queue.Empty:
+                return True
+            if slot is None:
+                return False
+            ring.release(slot)
+            if block:
+                return True
+
+    try:
+        for worker, path in jobs:
+            if not release(block=False):
+                return
+
+            try:
+                start_sec = time.perf_counter()
+                with soundfile.SoundFile(path) as f:
+                    shape = (f.frames,) if f.channels == 1 else (f.frames, f.channels)
+                    num_bytes = int(np.prod(shape)) * SAMPLE_BYTES
+                    if num_bytes > ring.size:
+                        raise ValueError(f"`{path}` needs {num_bytes} bytes but the shared audio buffer has {ring.size}")
+
+                    allocation = ring.allocate(num_bytes)
+                    while allocation is None:
+                        if not release(block=True):
+                            return
+                        allocation = ring.allocate(num_bytes)
+                    slot, offset = allocation
+
+                    f.read(dtype="int16", out=ring.view(offset, shape))
+                    sample_rate = f.samplerate
+                tracing.count("bytes read", num_bytes)
+            except Exception as e:
+                audio_queues[worker].put(DecoderError(path=path, message=str(e)))
+                continue
+
+            audio_queues[worker].put(
+                AudioDescriptor(
+                    path=path,
+                    decoder=decoder,
+                    segment=ring.name,
+                    slot=slot,
+                    offset=offset,
+                    shape=shape,
+                    sample_rate=sample_rate,
+                    decode_sec=time.perf_counter() - start_sec,
+                )
+            )
+
+        while not ring.is_empty():
+            if not release(block=True):
+                return
+    finally:
+        ring.close()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+    # The decoder owns the segment. Without this the resource tracker of an attaching process would unlink it on exit.
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class SharedAudioReader(object):
+    """Receives the utterances of one engine worker from the decoder processes as zero-copy int16 views."""
+
+    def __init__(self, audio_queue: Any, release_queues: Sequence[Any]) -> None:
+        self._audio_queue = audio_queue
+        self._release_queues = release_queues
+        self._segments: Dict[str, shared_memory.SharedMemory] = dict()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"_audio_queue": self._audio_queue, "_release_queues": self._release_queues, "_segments": dict()}
+
+    def get(self, path: str) -> Tuple[AudioDescriptor, NDArray]:
+        x = self._audio_queue.get()
+        if isinstance(x, DecoderError) and x.path is None:
+            raise RuntimeError(x.message)
+        if x.path != path:
+            raise ValueError(f"Expected `{path}` but the next shared utterance is `{x.path}`")
+        if isinstance(x, DecoderError):
+            raise RuntimeError(f"Failed to decode `{x.path}`: {x.message}")
+
+        if x.segment not in self._segments:
+            self._segments[x.segment] = _attach(x.segment)
+        audio = np.ndarray(x.shape, dtype=np.int16, buffer=self._segments[x.segment].buf, offset=x.offset)
+        return x, audio
+
+    def release(self, descriptor: AudioDescriptor) -> None:
+        """Hands the space of an utterance back to its decoder. Views of it must not be used afterwards."""
+
+        self._release_queues[descriptor.decoder].put(descriptor.slot)
+
+    def drain(self) -> None:
+        """Releases every descriptor already queued for this worker, so that a failing worker does not hold space."""
+
+        while True:
+            try:
+                x = self._audio_queue.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(x, AudioDescriptor):
+                self.release(x)
+
+    def close(self) -> None:
+        for shm in self._segments.values():
+            try:
+                shm.close()
+            except BufferError:
+                # A view is still referenced somewhere. The mapping goes away with the process.
+                pass
+        self._segments.clear()
+
+
+def stop_decoders(audio_queues: Sequence[Any], release_queues: Sequence[Any]) -> None:
+    """Stops the decoders and makes workers waiting for audio fail instead of waiting forever."""
+
+    for x in release_queues:
+        x.put(None)
+    for x in audio_queues:
+        x.put(DecoderError(path=None, message="Shared audio decoding was stopped"))
+
+
+def assign_jobs(worker_paths: Sequence[Sequence[str]], num_decoders: int) -> List[List[Tuple[int, str]]]:
+    """
+    Worker `i` is fed by decoder `i % num_decoders`. Every decoder interleaves the utterances of its workers so that
+    they all make progress.
+    """
+
+    res = [list() for _ in range(num_decoders)]
+    for decoder in range(num_decoders):
+        workers = list(range(decoder, len(worker_paths), num_decoders))
+        for position in range(max((len(worker_paths[w]) for w in workers), default=0)):
+            for w in workers:
+                if position < len(worker_paths[w]):
+                    res[decoder].append((w, worker_paths[w][position]))
+    return res
+
+
+__all__ = [
+    "AudioDescriptor",
+    "SharedAudioReader",
+    "assign_jobs",
+    "run_decoder",
+    "stop_decoders",
+]
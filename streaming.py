@@ -0,0 +1,152 @@
+import time
+from collections import namedtuple
+from enum import Enum
+from typing import (
+    Any,
+    Dict,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+import numpy as np
+from numpy.typing import NDArray
+
+
+class StreamingClocks(Enum):
+    REAL_TIME = "REAL_TIME"
+    VIRTUAL = "VIRTUAL"
+
+
+# Times are in seconds. `first_partial_sec` is measured from the start of the stream; `finalization_sec` from the end of
+# the audio until `flush` returns; `endpoint_delay_sec` from the end of the frame that produced the last partial until an
+# endpoint is reported, once per endpoint.
+StreamingStats = namedtuple(
+    "StreamingStats",
+    ["frame_sec", "first_partial_sec", "flush_sec", "finalization_sec", "endpoint_delay_sec"],
+)
+
+PERCENTILES = [50, 90, 99]
+
+
+def frames(audio: NDArray, frame_length: int) -> NDArray:
+    """Returns a `(num_frames, frame_length)` view of the audio without copying it. A trailing partial frame is dropped."""
+
+    num_frames = audio.size // frame_length
+    return audio[: num_frames * frame_length].reshape(num_frames, frame_length)
+
+
+class StreamClock(object):
+    """
+    Time since the start of a stream whose frames become available at 1x real time. `REAL_TIME` waits for every frame
+    and reads the wall clock. `VIRTUAL` processes frames as fast as possible and advances a simulated clock by the
+    measured processing time, never ahead of the audio that has arrived.
+    """
+
+    def __init__(self, clock: StreamingClocks) -> None:
+        self._clock = clock
+        self._start_sec = time.perf_counter()
+        self._now_sec = 0.0
+
+    def wait(self, available_sec: float) -> None:
+        if self._clock is StreamingClocks.REAL_TIME:
+            delay_sec = self._start_sec + available_sec - time.perf_counter()
+            if delay_sec > 0:
+                time.sleep(delay_sec)
+        else:
+            self._now_sec = max(self._now_sec, available_sec)
+
+    def advance(self, start_sec: float, end_sec: float) -> float:
+        """Accounts for work that ran between the `time.perf_counter` readings and returns the current stream time."""
+
+        if self._clock is StreamingClocks.REAL_TIME:
+            self._now_sec = end_sec - self._start_sec
+        else:
+            self._now_sec += end_sec - start_sec
+        return self._now_sec
+
+
+def stream(cheetah: Any, audio: NDArray, clock: StreamingClocks) -> Tuple[str, StreamingStats]:
+    """Feeds `audio` to a streaming engine (`process(frame) -> (partial, is_endpoint)` and `flush()`) frame by frame."""
+
+    frame_audio_sec = cheetah.frame_length / cheetah.sample_rate
+    audio_frames = frames(audio, cheetah.frame_length)
+
+    stream_clock = StreamClock(clock)
+    partials = list()
+    frame_sec = np.zeros(len(audio_frames))
+    first_partial_sec: Optional[float] = None
+    last_partial_sec: Optional[float] = None
+    endpoint_delay_sec = list()
+
+    for i, frame in enumerate(audio_frames):
+        available_sec = (i + 1) * frame_audio_sec
+        stream_clock.wait(available_sec)
+
+        start_sec = time.perf_counter()
+        partial, is_endpoint = cheetah.process(frame)
+        end_sec = time.perf_counter()
+        frame_sec[i] = end_sec - start_sec
+        now_sec = stream_clock.advance(start_sec, end_sec)
+
+        if len(partial) > 0:
+            partials.append(partial)
+            if first_partial_sec is None:
+                first_partial_sec = now_sec
+            last_partial_sec = available_sec
+        if is_endpoint and last_partial_sec is not None:
+            endpoint_delay_sec.append(now_sec - last_partial_sec)
+            last_partial_sec = None
+
+    audio_end_sec = len(audio_frames) * frame_audio_sec
+    stream_clock.wait(audio_end_sec)
+    start_sec = time.perf_counter()
+    partial = cheetah.flush()
+    end_sec = time.perf_counter()
+    now_sec = stream_clock.advance(start_sec, end_sec)
+
+    if len(partial) > 0:
+        partials.append(partial)
+        if first_partial_sec is None:
+            first_partial_sec = now_sec
+
+    stats = StreamingStats(
+        frame_sec=frame_sec.tolist(),
+        first_partial_sec=first_partial_sec,
+        flush_sec=end_sec - start_sec,
+        finalization_sec=now_sec - audio_end_sec,
+        endpoint_delay_sec=endpoint_delay_sec,
+    )
+
+    return "".join(partials), stats
+
+
+def summarize(stats: Sequence[StreamingStats]) -> Dict[str, float]:
+    """Percentiles of the per-frame times over all frames, and of the other latencies over all utterances."""
+
+    samples = {
+        "Frame ms": [1000 * x for s in stats for x in s.frame_sec],
+        "First partial sec": [s.first_partial_sec for s in stats if s.first_partial_sec is not None],
+        "Flush ms": [1000 * s.flush_sec for s in stats],
+        "Finalization ms": [1000 * s.finalization_sec for s in stats],
+        "Endpoint delay sec": [x for s in stats for x in s.endpoint_delay_sec],
+    }
+
+    res = dict()
+    for name, values in samples.items():
+        if len(values) == 0:
+            continue
+        for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            res[f"{name} p{p}"] = float(value)
+    return res
+
+
+__all__ = [
+    "PERCENTILES",
+    "StreamClock",
+    "StreamingClocks",
+    "StreamingStats",
+    "frames",
+    "stream",
+    "summarize",
+]
@@ -0,0 +1,269 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+from argparse import ArgumentParser
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional
+)
+
+import numpy as np
+import pvcheetah
+import soundfile
+from numpy.typing import NDArray
+
+from dataset import (
+    Dataset,
+    Datasets
+)
+from languages import Languages
+from streaming import (
+    PERCENTILES,
+    frames
+)
+
+DensityTrial = namedtuple(
+    "DensityTrial",
+    ["num_streams", "num_frames", "miss_rate", "latency_ms_percentiles", "frame_ms_percentiles"],
+)
+
+
+# Audio and Cheetah instances of this worker process, kept across trials
+_audio: Optional[NDArray] = None
+_create_params: Optional[Dict[str, Any]] = None
+_cheetahs: List[Any] = list()
+
+
+def init_process(access_key: str, model_path: Optional[str], library_path: Optional[str], audio: NDArray) -> None:
+    global _audio, _create_params
+
+    _audio = audio
+    _create_params = {"access_key": access_key, "model_path": model_path, "library_path": library_path}
+
+
+def run_streams(
+    num_streams: int,
+    first_stream: int,
+    total_streams: int,
+    ready: Any,
+    start_queue: Any,
+    duration_sec: float,
+    warmup_sec: float,
+) -> NDArray:
+    """
+    Runs `num_streams` Cheetah instances interleaved in this process, each fed at 1x real time from its own position in
+    the audio. Stream arrivals are staggered evenly within a frame across all `total_streams` of the trial. Instances are
+    created ahead of the trial, and every process of the trial waits on `ready` and then takes the common start time
+    from `start_queue`. Waiting also keeps a second trial task off a process that is already running one. Returns a
+    `(2, num_frames)` array with the latency after each frame became available and the time spent in `process`.
+    """
+
+    try:
+        while len(_cheetahs) < num_streams:
+            _cheetahs.append(pvcheetah.create(**_create_params))
+    except Exception:
+        # Releases the processes of the trial that already wait for this one
+        ready.abort()
+        raise
+    cheetahs = _cheetahs[:num_streams]
+
+    audio_frames = frames(_audio, cheetahs[0].frame_length)
+    frame_sec = cheetahs[0].frame_length / cheetahs[0].sample_rate
+    offsets_sec = [(first_stream + i) * frame_sec / total_streams for i in range(num_streams)]
+    positions = [(first_stream + i) * len(audio_frames) // total_streams for i in range(num_streams)]
+
+    num_warmup_ticks = int(warmup_sec / frame_sec)
+    num_ticks = num_warmup_ticks + int(duration_sec / frame_sec)
+    res = np.zeros((2, (num_ticks - num_warmup_ticks) * num_streams))
+
+    ready.wait()
+    start_sec = start_queue.get()
+
+    k = 0
+    for tick in range(num_ticks):
+        for i, cheetah in enumerate(cheetahs):
+            available_sec = start_sec + offsets_sec[i] + (tick + 1) * frame_sec
+            delay_sec = available_sec - time.time()
+            if delay_sec > 0:
+                time.sleep(delay_sec)
+
+            process_start_sec = time.time()
+            cheetah.process(audio_frames[(positions[i] + tick) % len(audio_frames)])
+            end_sec = time.time()
+
+            if tick >= num_warmup_ticks:
+                res[0, k] = end_sec - available_sec
+                res[1, k] = end_sec - process_start_sec
+                k += 1
+
+    # Starts the next trial from a fresh stream
+    for cheetah in cheetahs:
+        cheetah.flush()
+
+    return res
+
+
+def delete_streams(ready: Any) -> None:
+    ready.wait()
+    while len(_cheetahs) > 0:
+        _cheetahs.pop().delete()
+
+
+def load_audio(dataset: Dataset, audio_sec: float) -> NDArray:
+    chunks = list()
+    num_samples = 0
+    for index in range(dataset.size()):
+        audio, sample_rate = soundfile.read(dataset.get(index)[0], dtype="int16")
+        chunks.append(audio)
+        num_samples += audio.size
+        if num_samples >= audio_sec * sample_rate:
+            break
+    return np.concatenate(chunks)
+
+
+def main():
+    parser = ArgumentParser(description="Find how many real-time Picovoice Cheetah streams fit on the given processes")
+    parser.add_argument("--dataset", required=True, choices=[x.value for x in Datasets])
+    parser.add_argument("--dataset-folder", required=True)
+    parser.add_argument("--language", required=True, choices=[x.value for x in Languages])
+    parser.add_argument("--picovoice-access-key", required=True)
+    parser.add_argument("--picovoice-model-path", default=None)
+    parser.add_argument("--picovoice-library-path", default=None)
+    parser.add_argument("--num-processes", type=int, default=1, help="Streams are spread evenly across processes")
+    parser.add_argument("--min-streams", type=int, default=1)
+    parser.add_argument("--max-streams", type=int, default=256)
+    parser.add_argument("--step", type=int, default=1)
+    parser.add_argument("--trial-sec", type=float, default=30.0)
+    parser.add_argument("--warmup-sec", type=float, default=2.0)
+    parser.add_argument("--audio-sec", type=float, default=120.0, help="Seconds of audio the streams cycle over")
+    parser.add_argument(
+        "--deadline-ms",
+        type=float,
+        default=None,
+        help="A frame misses its deadline when it is processed later than this after it arrives (default one frame)",
+    )
+    parser.add_argument("--max-miss-rate", type=float, default=0.01, help="Fraction of frames allowed to be late")
+    parser.add_argument("--output", default=None, help="Path of the JSON file the latency curves are written to")
+    args = parser.parse_args()
+
+    language = Languages(args.language)
+    if args.picovoice_model_path is None and language is not Languages.EN:
+        raise ValueError("`picovoice-model-path` is required for non-EN languages")
+
+    dataset = Dataset.create(
+        Datasets(args.dataset),
+        folder=args.dataset_folder,
+        language=language,
+        punctuation=False,
+        punctuation_set="",
+    )
+    audio = load_audio(dataset, args.audio_sec)
+
+    cheetah = pvcheetah.create(
+        access_key=args.picovoice_access_key,
+        model_path=args.picovoice_model_path,
+        library_path=args.picovoice_library_path,
+    )
+    frame_ms = 1000 * cheetah.frame_length / cheetah.sample_rate
+    cheetah.delete()
+    deadline_ms = frame_ms if args.deadline_ms is None else args.deadline_ms
+
+    trials: List[DensityTrial] = list()
+    max_streams = 0
+    manager = multiprocessing.Manager()
+    executor = ProcessPoolExecutor(
+        args.num_processes,
+        initializer=init_process,
+        initargs=(args.picovoice_access_key, args.picovoice_model_path, args.picovoice_library_path, audio),
+    )
+    try:
+        num_streams = args.min_streams
+        while num_streams <= args.max_streams:
+            counts = [
+                num_streams // args.num_processes + int(i < num_streams % args.num_processes)
+                for i in range(args.num_processes)
+            ]
+            counts = [x for x in counts if x > 0]
+            ready = manager.Barrier(len(counts) + 1)
+            start_queue = manager.Queue()
+            futures = [
+                executor.submit(
+                    run_streams,
+                    num_streams=count,
+                    first_stream=sum(counts[:i]),
+                    total_streams=num_streams,
+                    ready=ready,
+                    start_queue=start_queue,
+                    duration_sec=args.trial_sec,
+                    warmup_sec=args.warmup_sec,
+                )
+                for i, count in enumerate(counts)
+            ]
+            # Every process has created its instances once it reaches the barrier
+            try:
+                ready.wait()
+            except threading.BrokenBarrierError:
+                errors = [future.exception() for future in futures]
+                raise next(x for x in errors if x is not None and not isinstance(x, threading.BrokenBarrierError))
+            start_sec = time.time() + 0.1
+            for _ in counts:
+                start_queue.put(start_sec)
+            res = np.concatenate([future.result() for future in futures], axis=1)
+
+            latency_ms = 1000 * res[0]
+            trial = DensityTrial(
+                num_streams=num_streams,
+                num_frames=latency_ms.size,
+                miss_rate=float(np.mean(latency_ms > deadline_ms)),
+                latency_ms_percentiles=[float(x) for x in np.percentile(latency_ms, PERCENTILES)],
+                frame_ms_percentiles=[float(x) for x in np.percentile(1000 * res[1], PERCENTILES)],
+            )
+            trials.append(trial)
+            print(
+                f"{num_streams} streams: {100 * trial.miss_rate:.2f}% frames late, latency ms "
+                + " ".join(f"p{p}={x:.1f}" for p, x in zip(PERCENTILES, trial.latency_ms_percentiles))
+                + ", frame ms "
+                + " ".join(f"p{p}={x:.2f}" for p, x in zip(PERCENTILES, trial.frame_ms_percentiles))
+            )
+
+            if trial.miss_rate > args.max_miss_rate:
+                break
+            max_streams = num_streams
+            num_streams += args.step
+
+        ready = manager.Barrier(args.num_processes)
+        for future in [executor.submit(delete_streams, ready) for _ in range(args.num_processes)]:
+            future.result()
+    finally:
+        executor.shutdown()
+        manager.shutdown()
+
+    print(f"Max real-time streams: {max_streams} ({max_streams / args.num_processes:.1f} per core)")
+
+    if args.output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "num_processes": args.num_processes,
+                    "frame_ms": frame_ms,
+                    "deadline_ms": deadline_ms,
+                    "max_miss_rate": args.max_miss_rate,
+                    "max_streams": max_streams,
+                    "max_streams_per_core": max_streams / args.num_processes,
+                    "percentiles": PERCENTILES,
+                    "trials": [x._asdict() for x in trials],
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
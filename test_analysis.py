@@ -0,0 +1,22 @@
+import unittest
+
+from analysis import align_rows
+from cache import ReplayRow
+from languages import Languages
+from scoring import reference_normalizer
+
+SENTENCE = "It costs 3.5 dollars, not 4. Was it 25,000? Yes, it was."
+
+
+class AlignRowsTestCase(unittest.TestCase):
+    def test_identical_transcript_of_punctuated_run_has_no_errors(self):
+        for punctuation, punctuation_sets in [(False, [",.?"]), (True, [",.?"]), (True, [",", ".?"])]:
+            reference = reference_normalizer(Languages.EN, punctuation, punctuation_sets).normalize(SENTENCE)
+            row = ReplayRow(0, 1.0, None, reference, SENTENCE, "0.flac")
+            (utterance,) = align_rows(Languages.EN, punctuation, punctuation_sets, [row])
+            self.assertEqual(utterance.num_errors, 0, msg=f"{punctuation_sets}")
+            self.assertGreater(utterance.num_words, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import random
+import tracemalloc
+import unittest
+from unittest import mock
+
+import editdistance
+
+from metric import (
+    Metric,
+    Metrics,
+    PunctuationErrorRate
+)
+
+
+def _alignment_cost(alignment, reference, prediction):
+    num_sub = sum(1 for i, j in alignment.items() if reference[i] != prediction[j])
+    return num_sub + (len(reference) - len(alignment)) + (len(prediction) - len(alignment))
+
+
+def _sentence(rng, num_words, vocabulary):
+    words = list()
+    for _ in range(num_words):
+        words.append(rng.choice(vocabulary))
+        if rng.random() < 0.1:
+            words.append(rng.choice(",.?"))
+    return " ".join(words)
+
+
+class PunctuationErrorRateTestCase(unittest.TestCase):
+    def test_long_reference_with_wrong_prediction_stays_below_max_dense_cells(self):
+        rng = random.Random(0)
+        reference = _sentence(rng, 3000, [f"r{i}" for i in range(50)])
+        prediction = _sentence(rng, 2800, [f"r{i}" for i in range(45, 95)])
+        ref_tokens = PunctuationErrorRate._token_regex(",.?").findall(reference)
+        pred_tokens = PunctuationErrorRate._token_regex(",.?").findall(prediction)
+        self.assertGreater((len(ref_tokens) + 1) * (len(pred_tokens) + 1), PunctuationErrorRate.MAX_DENSE_CELLS)
+
+        tracemalloc.start()
+        try:
+            alignment = PunctuationErrorRate._alignment(ref_tokens, pred_tokens)
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # A dense int64 matrix of these tokens takes more than 70 MB
+        self.assertLess(peak_bytes, 8 * PunctuationErrorRate.MAX_DENSE_CELLS)
+        self.assertEqual(_alignment_cost(alignment, ref_tokens, pred_tokens), editdistance.eval(ref_tokens, pred_tokens))
+
+        num_errors, num_tokens = Metric.create(Metrics.PER).calculate(prediction=prediction, reference=reference)
+        self.assertGreater(num_errors, 0)
+        self.assertGreaterEqual(num_tokens, num_errors)
+
+    def test_checkpointed_alignment_matches_dense(self):
+        per = Metric.create(Metrics.PER)
+        rng = random.Random(1)
+        vocabulary = ["a", "b", "c", "d", ",", "."]
+        pairs = [("a .", ". b")]
+        for _ in range(600):
+            reference = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 40)))
+            prediction = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 40)))
+            pairs.append((reference, prediction))
+
+        for reference, prediction in pairs:
+            ref_tokens = reference.split()
+            pred_tokens = prediction.split()
+            dense = PunctuationErrorRate._align(
+                PunctuationErrorRate._compute_dp_matrix(ref_tokens, pred_tokens), ref_tokens, pred_tokens
+            )
+            expected = per.calculate(prediction=prediction, reference=reference)
+            for max_dense_cells in (8, 64):
+                with mock.patch.object(PunctuationErrorRate, "MAX_DENSE_CELLS", max_dense_cells):
+                    self.assertEqual(PunctuationErrorRate._alignment(ref_tokens, pred_tokens), dense)
+                    self.assertEqual(per.calculate(prediction=prediction, reference=reference), expected)
+
+if __name__ == "__main__":
+    unittest.main()
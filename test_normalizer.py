@@ -0,0 +1,37 @@
+import random
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import inflect
+
+from languages import Languages
+from normalizer import (
+    EnglishNormalizer,
+    Normalizer
+)
+
+
+class EnglishNormalizerTestCase(unittest.TestCase):
+    def test_numbers_from_concurrent_threads(self):
+        rng = random.Random(0)
+        numbers = [str(rng.randint(0, 10**7)) for _ in range(20000)]
+        engine = inflect.engine()
+        expected = [engine.number_to_words(x).replace("-", " ").replace(",", "") for x in numbers]
+
+        normalizer = Normalizer.create(language=Languages.EN, keep_punctuation=False)
+        EnglishNormalizer._number_to_words.cache_clear()
+        switch_interval_sec = sys.getswitchinterval()
+        # Switching threads as often as possible interleaves the calls into `inflect`
+        sys.setswitchinterval(1e-6)
+        try:
+            with ThreadPoolExecutor(8) as executor:
+                actual = list(executor.map(normalizer.normalize, numbers))
+        finally:
+            sys.setswitchinterval(switch_interval_sec)
+
+        self.assertEqual([i for i, (x, y) in enumerate(zip(actual, expected)) if x != y], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from languages import Languages
+from normalizer import Normalizer
+from scoring import (
+    VariantScorer,
+    scoring_variants,
+    union_punctuation_set
+)
+
+SENTENCE = "It costs 3.5 dollars, not 4. Was it 25,000? Yes, it was."
+
+
+class VariantScorerTestCase(unittest.TestCase):
+    @staticmethod
+    def _reference(sentence, punctuation, punctuation_sets):
+        # The same way `Dataset.create` normalizes references
+        return Normalizer.create(
+            language=Languages.EN,
+            keep_punctuation=punctuation,
+            punctuation_set=union_punctuation_set(punctuation_sets),
+        ).normalize(sentence)
+
+    def _score(self, transcript, sentence, punctuation, punctuation_sets):
+        scorer = VariantScorer(Languages.EN, scoring_variants(punctuation, punctuation_sets))
+        return scorer.score(transcript=transcript, reference=self._reference(sentence, punctuation, punctuation_sets))
+
+    def test_identical_transcript_has_no_errors(self):
+        for punctuation, punctuation_sets in [(False, [",.?"]), (True, [",.?"]), (True, [",", ".?"]), (True, [".", ",?"])]:
+            scores = self._score(SENTENCE, SENTENCE, punctuation, punctuation_sets)
+            self.assertEqual(len(scores), 1 if len(punctuation_sets) == 1 else 1 + len(punctuation_sets))
+            for name, (num_errors, num_tokens) in scores.items():
+                self.assertEqual(num_errors, 0, msg=f"{name} of {punctuation_sets}")
+                self.assertGreater(num_tokens, 0, msg=f"{name} of {punctuation_sets}")
+
+    def test_punctuation_sets_are_scored_separately(self):
+        scores = self._score("It costs 3.5 dollars not 4. Was it 25,000? Yes, it was.", SENTENCE, True, [",", ".?"])
+        self.assertEqual(scores["WER"][0], 0)
+        self.assertEqual(scores["PER [,]"], (1, 2))
+        self.assertEqual(scores["PER [.?]"][0], 0)
+
+    def test_different_number_is_an_error(self):
+        scores = self._score("It costs 35 dollars, not 4. Was it 25,000? Yes, it was.", SENTENCE, True, [",", ".?"])
+        self.assertGreater(scores["WER"][0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
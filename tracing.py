@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional
+)
+
+CATEGORY = "benchmark"
+
+
+class Tracer(object):
+    """
+    Writes spans and counters of one process as Chrome trace events (one JSON object per line). Timestamps are wall
+    clock microseconds so that the traces of different workers line up once merged.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "w")
+        self._pid = os.getpid()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _write(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def complete(self, name: str, start_sec: float, end_sec: float) -> None:
+        self._write(
+            {
+                "name": name,
+                "cat": CATEGORY,
+                "ph": "X",
+                "ts": start_sec * 1e6,
+                "dur": (end_sec - start_sec) * 1e6,
+                "pid": self._pid,
+                "tid": threading.get_native_id(),
+            }
+        )
+
+    def count(self, name: str, delta: float) -> None:
+        with self._lock:
+            self._counters[name] += delta
+            value = self._counters[name]
+        self._write(
+            {
+                "name": name,
+                "cat": CATEGORY,
+                "ph": "C",
+                "ts": time.time() * 1e6,
+                "pid": self._pid,
+                "args": {name: value},
+            }
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def start(folder: str) -> None:
+    global _tracer
+
+    os.makedirs(folder, exist_ok=True)
+    _tracer = Tracer(os.path.join(folder, f"{uuid.uuid4().hex}.jsonl"))
+
+
+def stop() -> None:
+    global _tracer
+
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Records the duration of the enclosed block. Does nothing unless this process is tracing."""
+
+    if _tracer is None:
+        yield
+        return
+
+    start_sec = time.time()
+    try:
+        yield
+    finally:
+        _tracer.complete(name, start_sec, time.time())
+
+
+def count(name: str, delta: float = 1) -> None:
+    if _tracer is not None:
+        _tracer.count(name, delta)
+
+
+def run_traced(folder: str, fn: Callable, *args, **kwargs) -> Any:
+    """Calls `fn` with tracing enabled in this process and writes its events to its own file inside `folder`."""
+
+    start(folder)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        stop()
+
+
+def clear_traces(folder: str) -> None:
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+
+
+def load_events(folder: str) -> List[Dict[str, Any]]:
+    events = list()
+    if not os.path.exists(folder):
+        return events
+
+    for x in sorted(os.listdir(folder)):
+        if not x.endswith(".jsonl"):
+            continue
+        with open(os.path.join(folder, x)) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+    return events
+
+
+def merge_traces(folder: str, path: str) -> Dict[str, float]:
+    """
+    Merges the worker traces in `folder` into a Chrome trace JSON file (`chrome://tracing` or Perfetto) with one
+    process per worker, and returns the total seconds spent in each span name across workers.
+    """
+
+    events = load_events(folder)
+    pids = sorted(set(x["pid"] for x in events))
+    metadata = [
+        {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"Worker {i}"}} for i, pid in enumerate(pids)
+    ]
+
+    with open(path, "w") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+
+    totals: Dict[str, float] = defaultdict(float)
+    for x in events:
+        if x["ph"] == "X":
+            totals[x["name"]] += x["dur"] / 1e6
+    return dict(totals)
+
+
+__all__ = [
+    "clear_traces",
+    "count",
+    "merge_traces",
+    "run_traced",
+    "span",
+    "start",
+    "stop",
+]
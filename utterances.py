@@ -0,0 +1,115 @@
+from enum import Enum
+from typing import (
+    Dict,
+    List,
+    Sequence
+)
+
+import numpy as np
+from numpy.typing import NDArray
+
+from journal import UtteranceResult
+
+ERRORS_PREFIX = "errors:"
+TOKENS_PREFIX = "tokens:"
+
+# Strings are stored as one UTF-8 buffer plus offsets, so that `.npz` files load without pickling
+STRING_DATA_SUFFIX = ".data"
+STRING_OFFSETS_SUFFIX = ".offsets"
+
+
+class UtteranceTableFormats(Enum):
+    NPZ = "npz"
+    PARQUET = "parquet"
+
+
+def utterance_columns(results: Sequence[UtteranceResult]) -> Dict[str, NDArray]:
+    """Returns one column per field, sorted by dataset index. Metrics an utterance was not scored with are `-1`."""
+
+    results = sorted(results, key=lambda x: x.index)
+
+    def column(values: Sequence, dtype: type, missing=-1) -> NDArray:
+        return np.array([missing if x is None else x for x in values], dtype=dtype)
+
+    columns = {
+        "index": column([x.index for x in results], np.int64),
+        "audio_path": np.array(["" if x.audio_path is None else x.audio_path for x in results], dtype=str),
+        "duration_sec": column([x.duration_sec for x in results], np.float64, missing=np.nan),
+        "audio_sec": column([x.audio_sec for x in results], np.float64),
+        "process_sec": column([x.process_sec for x in results], np.float64),
+        "num_reference_words": column([x.num_reference_words for x in results], np.int32),
+        "num_transcript_words": column([x.num_transcript_words for x in results], np.int32),
+        "warmup": np.array([bool(x.warmup) for x in results], dtype=bool),
+    }
+
+    metric_names = list(dict.fromkeys(k for x in results for k in x.num_errors.keys()))
+    for metric_name in metric_names:
+        columns[f"{ERRORS_PREFIX}{metric_name}"] = column([x.num_errors.get(metric_name) for x in results], np.int32)
+        columns[f"{TOKENS_PREFIX}{metric_name}"] = column([x.num_tokens.get(metric_name) for x in results], np.int32)
+
+    return columns
+
+
+def _encode_strings(values: NDArray) -> List[NDArray]:
+    encoded = [x.encode("utf-8") for x in values.tolist()]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in encoded], out=offsets[1:])
+    return [np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets]
+
+
+def _decode_strings(data: NDArray, offsets: NDArray) -> NDArray:
+    buffer = data.tobytes()
+    offsets = offsets.tolist()
+    return np.array([buffer[offsets[i] : offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)], dtype=str)
+
+
+def save_utterance_table(path: str, columns: Dict[str, NDArray], table_format: UtteranceTableFormats) -> None:
+    if table_format is UtteranceTableFormats.NPZ:
+        arrays = dict()
+        for name, values in columns.items():
+            if values.dtype.kind == "U":
+                arrays[f"{name}{STRING_DATA_SUFFIX}"], arrays[f"{name}{STRING_OFFSETS_SUFFIX}"] = _encode_strings(values)
+            else:
+                arrays[name] = values
+        with open(path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+    elif table_format is UtteranceTableFormats.PARQUET:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Writing Parquet utterance tables requires `pyarrow`")
+        pyarrow.parquet.write_table(pyarrow.table(columns), path)
+    else:
+        raise ValueError(f"Cannot save utterance table of type `{table_format}`")
+
+
+def load_utterance_table(path: str) -> Dict[str, NDArray]:
+    if path.endswith(f".{UtteranceTableFormats.PARQUET.value}"):
+        import pyarrow.parquet
+
+        table = pyarrow.parquet.read_table(path)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+
+    columns = dict()
+    with np.load(path) as arrays:
+        for name in arrays.files:
+            if name.endswith(STRING_DATA_SUFFIX):
+                name = name[: -len(STRING_DATA_SUFFIX)]
+                columns[name] = _decode_strings(
+                    arrays[f"{name}{STRING_DATA_SUFFIX}"],
+                    arrays[f"{name}{STRING_OFFSETS_SUFFIX}"],
+                )
+            elif not name.endswith(STRING_OFFSETS_SUFFIX):
+                columns[name] = arrays[name]
+    return columns
+
+
+__all__ = [
+    "ERRORS_PREFIX",
+    "TOKENS_PREFIX",
+    "UtteranceTableFormats",
+    "load_utterance_table",
+    "save_utterance_table",
+    "utterance_columns",
+]